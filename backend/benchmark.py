@@ -0,0 +1,224 @@
+# coding: utf-8
+"""This script times the controllers against a scratch database."""
+
+from os import chdir, getcwd, makedirs
+from os.path import getsize
+from shutil import rmtree
+from sys import argv
+from tempfile import mkdtemp
+from time import perf_counter, time
+from typing import Callable
+from uuid import uuid4
+
+import utils
+
+from controller_group import GroupController
+from controller_invite import INVITE_INSERT_QUERY, InviteController
+from controller_task import TASK_INSERT_QUERY, TaskController
+from db_pool import close_all_pools
+from utils import db_operation, new_id
+from validator import CREATE_TASK_TABLE, Validator
+
+PASSWORD: str = "benchmark"
+
+
+def make_sandbox() -> str:
+    """Moves into a new folder holding an empty database."""
+    sandbox: str = mkdtemp(prefix="roomiebuddy_bench_")
+    chdir(sandbox)
+    makedirs("data", exist_ok=True)
+    makedirs("log", exist_ok=True)
+    Validator().initializer()
+    return sandbox
+
+
+def time_call(function: Callable[[], object], repeat: int = 5) -> float:
+    """Returns the best time of a call in milliseconds."""
+    best: float = float("inf")
+    for _ in range(repeat):
+        started: float = perf_counter()
+        function()
+        best = min(best, perf_counter() - started)
+    return best * 1000
+
+
+def seed_users(count: int) -> list[str]:
+    """Adds users and returns their ids."""
+    user_ids: list[str] = [str(uuid4()) for _ in range(count)]
+    with db_operation() as data_cursor:
+        data_cursor.executemany(
+            "INSERT INTO user (uuid, username, email, password, image_path) "
+            "VALUES (?, ?, ?, ?, ?);",
+            [(user_id, user_id, f"{user_id}@bench", PASSWORD, "") for user_id in user_ids],
+        )
+    return user_ids
+
+
+def seed_group(owner_id: str, member_ids: list[str]) -> str:
+    """Adds a group with the given members and returns its id."""
+    group_id: str = str(uuid4())
+    with db_operation() as data_cursor:
+        data_cursor.execute(
+            "INSERT INTO task_group (uuid, name, description, owner_id) "
+            "VALUES (?, ?, ?, ?);",
+            (group_id, group_id[:8], "", owner_id),
+        )
+        data_cursor.executemany(
+            "INSERT INTO group_user (group_id, user_id, role_id) VALUES (?, ?, ?);",
+            [(group_id, member_id, "member") for member_id in member_ids],
+        )
+    return group_id
+
+
+def seed_tasks(group_id: str, member_ids: list[str], count: int) -> None:
+    """Adds tasks assigned round robin between the members."""
+    with db_operation() as data_cursor:
+        data_cursor.executemany(
+            TASK_INSERT_QUERY,
+            [
+                (
+                    str(uuid4()),
+                    f"task {index}",
+                    "",
+                    1767225600.0 + index * 3600,
+                    1,
+                    0,
+                    0,
+                    member_ids[index % len(member_ids)],
+                    member_ids[(index + 1) % len(member_ids)],
+                    group_id,
+                    index % 2,
+                    index % 3,
+                    0,
+                    "",
+                )
+                for index in range(count)
+            ],
+        )
+
+
+def bench_task_listing() -> None:
+    """Times the group and user task listings against the task count."""
+    print("tasks  get_group_task (ms)  get_user_task (ms)")
+    for count in (10, 100, 500, 1000, 5000):
+        member_ids: list[str] = seed_users(4)
+        group_id: str = seed_group(member_ids[0], member_ids)
+        seed_tasks(group_id, member_ids, count)
+        group_ms: float = time_call(
+            lambda: TaskController().get_group_task_control(
+                user_id=member_ids[0], group_id=group_id, password=PASSWORD
+            )
+        )
+        user_ms: float = time_call(
+            lambda: TaskController().get_user_task_control(
+                user_id=member_ids[0], password=PASSWORD
+            )
+        )
+        print(f"{count:5}  {group_ms:19.2f}  {user_ms:18.2f}")
+
+
+def bench_group_listing() -> None:
+    """Times the group listing of a user in many groups with many members."""
+    print("groups  members  get_group_list (ms)")
+    for group_count, member_count in ((5, 5), (20, 10), (50, 20), (100, 50)):
+        user_id: str = seed_users(1)[0]
+        for _ in range(group_count):
+            seed_group(user_id, [user_id] + seed_users(member_count - 1))
+        list_ms: float = time_call(
+            lambda: GroupController().get_group_control(
+                user_id=user_id, password=PASSWORD
+            )
+        )
+        print(f"{group_count:6}  {member_count:7}  {list_ms:19.2f}")
+
+
+def bench_sent_invites() -> None:
+    """Times the sent invites of a group against resolving names row by row."""
+    print("invites  row by row (ms)  joined (ms)  page of 50 (ms)")
+    for count in (100, 500, 2_000):
+        owner_id: str = seed_users(1)[0]
+        group_id: str = seed_group(owner_id, [owner_id])
+        invitee_ids: list[str] = seed_users(count)
+        with db_operation() as data_cursor:
+            data_cursor.executemany(
+                INVITE_INSERT_QUERY,
+                [
+                    (new_id(), group_id, owner_id, invitee_id, "", time())
+                    for invitee_id in invitee_ids
+                ],
+            )
+
+        def row_by_row() -> None:
+            """Lists the invites the way the controller used to."""
+            with db_operation() as data_cursor:
+                data_cursor.execute(
+                    "SELECT invite_id, inviter_id, invitee_id, day_created "
+                    "FROM group_invites WHERE group_id = ?;",
+                    (group_id,),
+                )
+                for invite in data_cursor.fetchall():
+                    for user_id in (invite[1], invite[2]):
+                        data_cursor.execute(
+                            "SELECT username FROM user WHERE uuid = ?;", (user_id,)
+                        )
+                        data_cursor.fetchone()
+
+        row_ms: float = time_call(row_by_row)
+        joined_ms: float = time_call(
+            lambda: InviteController().sent_invite_control(
+                user_id=owner_id, group_id=group_id, password=PASSWORD
+            )
+        )
+        page_ms: float = time_call(
+            lambda: InviteController().sent_invite_control(
+                user_id=owner_id, group_id=group_id, password=PASSWORD, limit=50
+            )
+        )
+        print(f"{count:7}  {row_ms:15.2f}  {joined_ms:11.2f}  {page_ms:15.2f}")
+
+
+def bench_id_order(total: int = 1_200_000, batch: int = 10_000) -> None:
+    """Times task inserts with random against time ordered ids."""
+    print("scheme  rows      rows/s (last 200k)  file (MB)")
+    for scheme in ("uuid4", "uuid7"):
+        utils.ID_SCHEME = scheme
+        db_name: str = f"data/{scheme}.db"
+        with db_operation(db_name) as data_cursor:
+            data_cursor.execute(CREATE_TASK_TABLE)
+        window_start: float = perf_counter()
+        for inserted in range(batch, total + 1, batch):
+            with db_operation(db_name) as data_cursor:
+                data_cursor.executemany(
+                    TASK_INSERT_QUERY,
+                    [
+                        (new_id(), "task", "", 0.0, 1, 0, 0, "a", "b", "g", 0, 0, 0, "")
+                        for _ in range(batch)
+                    ],
+                )
+            if inserted % 200_000 == 0:
+                rate: float = 200_000 / (perf_counter() - window_start)
+                size: float = getsize(db_name) / 1_000_000
+                print(f"{scheme}   {inserted:8}  {rate:18.0f}  {size:9.1f}")
+                window_start = perf_counter()
+
+
+BENCHMARKS: dict[str, Callable[[], None]] = {
+    "task_listing": bench_task_listing,
+    "group_listing": bench_group_listing,
+    "sent_invites": bench_sent_invites,
+    "id_order": bench_id_order,
+}
+
+
+if __name__ == "__main__":
+    selected: list[str] = argv[1:] or list(BENCHMARKS)
+    original_folder: str = getcwd()
+    for bench_name in selected:
+        print(f"== {bench_name} ==")
+        bench_folder: str = make_sandbox()
+        try:
+            BENCHMARKS[bench_name]()
+        finally:
+            close_all_pools()
+            chdir(original_folder)
+            rmtree(bench_folder)
@@ -0,0 +1,83 @@
+# coding: utf-8
+"""This module holds the in-process caches of the backend."""
+
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from typing import Any, Callable, Hashable
+
+
+class LRUCache:
+    """This class keeps the most recently used entries up to a maximum size.
+
+    With a ttl, entries older than ttl seconds count as missing. The cache
+    lives in one process, so every worker process has its own.
+    """
+
+    def __init__(self, max_size: int, ttl: float | None = None) -> None:
+        """Initialize an empty cache."""
+        self.max_size: int = max_size
+        self.ttl: float | None = ttl
+        self.hits: int = 0
+        self.misses: int = 0
+        # key -> (value, monotonic time the entry expires at)
+        self._entries: OrderedDict[Hashable, tuple[Any, float]] = OrderedDict()
+        self._lock: Lock = Lock()
+
+    def get(self, key: Hashable) -> Any | None:
+        """Gets an entry and marks it as recently used, None if missing."""
+        with self._lock:
+            entry: tuple[Any, float] | None = self._entries.get(key)
+            if entry is not None and entry[1] < monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Adds or replaces an entry, evicting the least recently used one."""
+        expires_at: float = float("inf") if self.ttl is None else monotonic() + self.ttl
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        """Removes an entry if it is cached."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def pop_where(self, predicate: Callable[[Hashable, Any], bool]) -> None:
+        """Removes every entry matching the predicate."""
+        with self._lock:
+            for key in [
+                key
+                for key, (value, _expires_at) in self._entries.items()
+                if predicate(key, value)
+            ]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        """Removes every entry."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict[str, int | float | None]:
+        """Gets the size and the hit and miss counters of the cache."""
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+if __name__ == "__main__":
+    print("This module is not intended to be run directly.")
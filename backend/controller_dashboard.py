@@ -0,0 +1,61 @@
+# coding: utf-8
+"""This module gathers everything the home screens show for database."""
+
+from typing import Any
+
+from controller_group import GROUP_LISTING_QUERY, group_rows_to_dict
+from controller_invite import PENDING_INVITES_QUERY, invite_row_to_dict
+from controller_task import (
+    make_sync_cursor,
+    sync_scope_digest,
+    sync_task_query,
+    task_row_to_dict,
+)
+from error import BackendError
+from utils import db_operation
+from validator import Authorization, Validator, invite_expiry
+
+
+class DashboardController:
+    """This class handles the dashboard functions for the database."""
+
+    def __init__(self) -> None:
+        """Initialize the DashboardController class."""
+        return
+
+    def get_dashboard_control(self, user_id: str, password: str) -> dict[str, Any]:
+        """Gets the groups, pending invites and tasks of a user at once.
+
+        Every query runs on one cursor in one transaction, so the parts agree
+        with each other. The tasks come with a cursor for /sync_tasks.
+        """
+        authorization: Authorization = Validator().authorize(
+            user_id=user_id, password=password
+        )
+        if not authorization.user_exists:
+            raise BackendError("Backend Error: User does not exist", "304")
+        if not authorization.password_correct:
+            raise BackendError("Backend Error: Password is incorrect", "305")
+        with db_operation() as data_cursor:
+            data_cursor.execute(GROUP_LISTING_QUERY, (user_id,))
+            groups: dict[str, dict] = group_rows_to_dict(data_cursor.fetchall())
+            data_cursor.execute(PENDING_INVITES_QUERY, (user_id, invite_expiry()))
+            invite_list: list[tuple] = data_cursor.fetchall()
+            data_cursor.execute("SELECT version FROM task_sync;")
+            version: int = data_cursor.fetchone()[0]
+            # Every version, the tasks of the groups and those assigned to the user.
+            group_ids: list[str] = list(groups)
+            data_cursor.execute(
+                sync_task_query(len(group_ids)), (*group_ids, -1, user_id, -1)
+            )
+            task_list: list[tuple] = data_cursor.fetchall()
+        return {
+            "groups": groups,
+            "invites": {invite[0]: invite_row_to_dict(invite) for invite in invite_list},
+            "tasks": {task[0]: task_row_to_dict(task) for task in task_list},
+            "cursor": make_sync_cursor(version, sync_scope_digest(group_ids)),
+        }
+
+
+if __name__ == "__main__":
+    print("This module is not intended to be run directly.")
@@ -1,11 +1,45 @@
 # coding: utf-8
 """This module handles the functions related to group for database."""
 
-from uuid import uuid4
-
 from error import BackendError
-from utils import db_operation
-from validator import Validator
+from utils import db_operation, insert_with_new_id
+from validator import Authorization, Validator
+
+# The groups of a user joined with every member of those groups, one row
+# per (group, member) pair.
+GROUP_LISTING_QUERY: str = (
+    "SELECT task_group.uuid, task_group.name, task_group.description, "
+    "task_group.owner_id, member.user_id, user.username "
+    "FROM group_user AS mine "
+    "JOIN task_group ON task_group.uuid = mine.group_id "
+    "JOIN group_user AS member ON member.group_id = mine.group_id "
+    "JOIN user ON user.uuid = member.user_id "
+    "WHERE mine.user_id = ?;"
+)
+
+GROUP_MEMBERS_QUERY: str = "SELECT user_id FROM group_user WHERE group_id = ?;"
+
+
+def group_rows_to_dict(rows: list[tuple]) -> dict[str, dict]:
+    """Folds the rows of GROUP_LISTING_QUERY into groups with their members."""
+    groups: dict[str, dict] = {}
+    seen: set[tuple[str, str]] = set()
+    for group_id, name, description, owner_id, member_id, member_name in rows:
+        if (group_id, member_id) in seen:
+            continue
+        seen.add((group_id, member_id))
+        if group_id not in groups:
+            groups[group_id] = {
+                "group_id": group_id,
+                "name": name,
+                "description": description,
+                "owner_id": owner_id,
+                "members": [],
+            }
+        groups[group_id]["members"].append(
+            {"user_id": member_id, "username": member_name}
+        )
+    return groups
 
 
 class GroupController:
@@ -23,22 +57,25 @@ class GroupController:
         password: str,
     ) -> str:
         """This will create a group."""
-        if not Validator().check_user_exists(user_id):
+        authorization: Authorization = Validator().authorize(
+            user_id=user_id, password=password
+        )
+        if not authorization.user_exists:
             raise BackendError("Backend Error: User does not exist", "304")
-        if not Validator().check_password(user_id, password):
+        if not authorization.password_correct:
             raise BackendError("Backend Error: Password is incorrect", "305")
-        group_id: str = str(uuid4())
-        while Validator().check_duplicate_id("group", group_id):
-            group_id = str(uuid4())
         with db_operation() as data_cursor:
-            data_cursor.execute(
-                "INSERT INTO task_group VALUES (?, ?, ?, ?);",
-                (group_id, group_name, description, user_id),
+            group_id: str = insert_with_new_id(
+                data_cursor,
+                "INSERT INTO task_group (uuid, name, description, owner_id) "
+                "VALUES (?, ?, ?, ?);",
+                lambda new_group_id: (new_group_id, group_name, description, user_id),
             )
             data_cursor.execute(
-                "INSERT INTO group_user VALUES (?, ?, ?);",
+                "INSERT INTO group_user (group_id, user_id, role_id) VALUES (?, ?, ?);",
                 (group_id, user_id, None),
             )
+        Validator().invalidate_membership(user_id)
         return group_id
 
     def add_user_to_group_control(
@@ -48,19 +85,23 @@ class GroupController:
         password: str,
     ) -> None:
         """Adds a user to a group."""
-        if not Validator().check_user_exists(user_id):
+        authorization: Authorization = Validator().authorize(
+            user_id=user_id, password=password, group_id=group_id
+        )
+        if not authorization.user_exists:
             raise BackendError("Backend Error: User does not exist", "304")
-        if not Validator().check_password(user_id, password):
+        if not authorization.password_correct:
             raise BackendError("Backend Error: Password is incorrect", "305")
-        if not Validator().check_group_exists(group_id):
+        if not authorization.group_exists:
             raise BackendError("Backend Error: Group does not exist", "306")
-        if Validator().check_user_in_group(user_id, group_id):
+        if authorization.in_group:
             raise BackendError("Backend Error: User already in group", "307")
         with db_operation() as data_cursor:
             data_cursor.execute(
-                "INSERT INTO group_user VALUES (?, ?);",
+                "INSERT INTO group_user (group_id, user_id) VALUES (?, ?);",
                 (group_id, user_id),
             )
+        Validator().invalidate_membership(user_id)
 
     def leave_group_control(
         self,
@@ -69,13 +110,16 @@ class GroupController:
         password: str,
     ) -> None:
         """Removes a user from a group"""
-        if not Validator().check_user_exists(user_id):
+        authorization: Authorization = Validator().authorize(
+            user_id=user_id, password=password, group_id=group_id
+        )
+        if not authorization.user_exists:
             raise BackendError("Backend Error: User does not exist", "304")
-        if not Validator().check_password(user_id, password):
+        if not authorization.password_correct:
             raise BackendError("Backend Error: Password is incorrect", "305")
-        if not Validator().check_group_exists(group_id):
+        if not authorization.group_exists:
             raise BackendError("Backend Error: Group does not exist", "306")
-        if not Validator().check_user_in_group(user_id, group_id):
+        if not authorization.in_group:
             raise BackendError("Backend Error: User not in group", "308")
         with db_operation() as data_cursor:
             data_cursor.execute(
@@ -96,6 +140,7 @@ class GroupController:
                     "DELETE FROM group_invites WHERE group_id = ?;",
                     (group_id,),
                 )
+        Validator().invalidate_membership(user_id)
 
     def delete_group_control(
         self,
@@ -104,14 +149,17 @@ class GroupController:
         password: str,
     ) -> None:
         """Deletes a group"""
-        if not Validator().check_group_exists(group_id):
+        authorization: Authorization = Validator().authorize(
+            user_id=user_id, password=password, group_id=group_id
+        )
+        if not authorization.group_exists:
             raise BackendError("Backend Error: Group does not exist", "306")
-        if not Validator().check_user_exists(user_id):
+        if not authorization.user_exists:
             raise BackendError("Backend Error: User does not exist in group", "304")
-        if not Validator().check_password(user_id, password):
+        if not authorization.password_correct:
             raise BackendError("Backend Error: Password is incorrect", "305")
-        if not Validator().check_user_in_group(user_id, group_id):
-            raise Exception("User is not a member of the group.")
+        if not authorization.in_group:
+            raise BackendError("Backend Error: User is not in the group", "310")
         with db_operation() as data_cursor:
             data_cursor.execute(
                 "SELECT * FROM task_group WHERE uuid = ? AND owner_id = ?;",
@@ -133,6 +181,7 @@ class GroupController:
                 "DELETE FROM group_invites WHERE group_id = ?;",
                 (group_id,),
             )
+        Validator().invalidate_group_membership(group_id)
 
     def get_group_control(
         self,
@@ -140,73 +189,17 @@ class GroupController:
         password: str,
     ) -> dict[str, dict]:
         """Gets all groups a user is a member of and their members."""
-        if not Validator().check_user_exists(user_id):
+        authorization: Authorization = Validator().authorize(
+            user_id=user_id, password=password
+        )
+        if not authorization.user_exists:
             raise BackendError("Backend Error: User does not exist", "304")
-        if not Validator().check_password(user_id, password):
+        if not authorization.password_correct:
             raise BackendError("Backend Error: Password is incorrect", "305")
         with db_operation() as data_cursor:
-            data_cursor.execute(
-                """
-                SELECT group_id
-                FROM group_user
-                WHERE user_id = ?
-                """,
-                (user_id,),
-            )
-            group_ids = [row[0] for row in data_cursor.fetchall()]
-            if not group_ids:
-                return {}
-
-            placeholders = ",".join("?" for _ in group_ids)
-            data_cursor.execute(
-                f"""
-                SELECT uuid, name, description, owner_id
-                FROM task_group
-                WHERE uuid IN ({placeholders})
-                """,
-                group_ids,
-            )
-            groups_data = data_cursor.fetchall()
-
-            groups: dict[str, dict] = {}
-            for group in groups_data:
-                group_id, name, description, owner_id = group
-                data_cursor.execute(
-                    """
-                    SELECT user_id
-                    FROM group_user
-                    WHERE group_id = ?
-                    """,
-                    (group_id,),
-                )
-                user_ids = [row[0] for row in data_cursor.fetchall()]
-
-                if user_ids:
-                    placeholders = ",".join("?" for _ in user_ids)
-                    data_cursor.execute(
-                        f"""
-                        SELECT uuid, username
-                        FROM user
-                        WHERE uuid IN ({placeholders})
-                        """,
-                        user_ids,
-                    )
-                    members_data = data_cursor.fetchall()
-                else:
-                    members_data = []
-                members = [
-                    {"user_id": member_id, "username": member_name}
-                    for member_id, member_name in members_data
-                ]
-
-                groups[group_id] = {
-                    "group_id": group_id,
-                    "name": name,
-                    "description": description,
-                    "owner_id": owner_id,
-                    "members": members,
-                }
-        return groups
+            data_cursor.execute(GROUP_LISTING_QUERY, (user_id,))
+            rows: list[tuple] = data_cursor.fetchall()
+        return group_rows_to_dict(rows)
 
     def get_group_members_control(
         self,
@@ -215,24 +208,20 @@ class GroupController:
         password: str,
     ) -> list[dict]:
         """Gets all members of a specific group."""
-        if not Validator().check_user_exists(user_id):
+        authorization: Authorization = Validator().authorize(
+            user_id=user_id, password=password, group_id=group_id
+        )
+        if not authorization.user_exists:
             raise BackendError("Backend Error: User does not exist", "304")
-        if not Validator().check_password(user_id, password):
+        if not authorization.password_correct:
             raise BackendError("Backend Error: Password is incorrect", "305")
-        if not Validator().check_group_exists(group_id):
+        if not authorization.group_exists:
             raise BackendError("Backend Error: Group does not exist", "306")
-        if not Validator().check_user_in_group(user_id, group_id):
+        if not authorization.in_group:
             raise BackendError("Backend Error: User not in group", "308")
         with db_operation() as data_cursor:
             # Get all users in the group
-            data_cursor.execute(
-                """
-                SELECT user_id
-                FROM group_user
-                WHERE group_id = ?
-                """,
-                (group_id,),
-            )
+            data_cursor.execute(GROUP_MEMBERS_QUERY, (group_id,))
             user_ids = [row[0] for row in data_cursor.fetchall()]
 
             if not user_ids:
@@ -1,15 +1,18 @@
 # coding: utf-8
 """This module handles image processing and storage."""
 
-from os import remove
-from os.path import exists, join
+from os.path import exists
 from typing import Any
 
-from werkzeug.utils import secure_filename
-
 from error import BackendError
-from utils import db_operation
-from validator import Validator, UPLOAD_FOLDER, ALLOWED_EXTENSIONS
+from image_store import (
+    discard_upload,
+    hash_upload,
+    place_image,
+    remove_unreferenced_images,
+)
+from utils import call_after_commit, call_after_rollback, db_operation
+from validator import Authorization, Validator, ALLOWED_EXTENSIONS
 
 
 class ImageController:
@@ -25,6 +28,30 @@ class ImageController:
             "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
         )
 
+    def save_image(self, file, table: str, row_id: str) -> str:
+        """Stores an upload and points the image of a user or task row at it.
+
+        The file is moved in place only once the reference is committed, a
+        rolled back request deletes the upload instead, so no file is left
+        without its image row. The image the row had before is deleted
+        after the commit, unless another row still uses it.
+        """
+        extension: str = file.filename.rsplit(".", 1)[1].lower()
+        temp_path, path = hash_upload(file.stream, extension)
+        try:
+            with db_operation() as data_cursor:
+                data_cursor.execute(
+                    f"UPDATE {table} SET image_path = ? WHERE uuid = ?;",
+                    (path, row_id),
+                )
+        except BaseException:
+            discard_upload(temp_path)
+            raise
+        call_after_rollback(lambda: discard_upload(temp_path))
+        call_after_commit(lambda: place_image(temp_path, path))
+        call_after_commit(remove_unreferenced_images)
+        return path
+
     def get_user_image_control(
         self,
         image_url: str,
@@ -32,9 +59,12 @@ class ImageController:
         password: str,
     ) -> str:
         """Gets the user image."""
-        if not Validator().check_user_exists(user_id=user_id):
+        authorization: Authorization = Validator().authorize(
+            user_id=user_id, password=password
+        )
+        if not authorization.user_exists:
             raise BackendError("Backend Error: User does not exist", "304")
-        if not Validator().check_password(user_id=user_id, password=password):
+        if not authorization.password_correct:
             raise BackendError("Backend Error: Password is incorrect", "305")
         if not exists(image_url):
             raise BackendError("Backend Error: Image does not exist", "313")
@@ -45,17 +75,19 @@ class ImageController:
         request_data: dict[str, Any],
     ) -> str:
         """Gets the task image."""
-        if not Validator().check_user_exists(user_id=request_data["user_id"]):
+        authorization: Authorization = Validator().authorize(
+            user_id=request_data["user_id"],
+            password=request_data["password"],
+            group_id=request_data["group_id"],
+            task_id=request_data["task_id"],
+        )
+        if not authorization.user_exists:
             raise BackendError("Backend Error: User does not exist", "304")
-        if not Validator().check_password(
-            user_id=request_data["user_id"], password=request_data["password"]
-        ):
+        if not authorization.password_correct:
             raise BackendError("Backend Error: Password is incorrect", "305")
-        if not Validator().check_task_exists(task_id=request_data["task_id"]):
+        if not authorization.task_exists:
             raise BackendError("Backend Error: Task does not exist", "309")
-        if (request_data["group_id"] != "0") and not Validator().check_group_exists(
-            group_id=request_data["group_id"]
-        ):
+        if (request_data["group_id"] != "0") and not authorization.group_exists:
             raise BackendError("Backend Error: Group does not exist", "306")
         if not exists(request_data["image_url"]):
             raise BackendError("Backend Error: Image does not exist", "313")
@@ -68,25 +100,18 @@ class ImageController:
         file,
     ) -> str:
         """Uploads the user image."""
-        if not Validator().check_user_exists(user_id=user_id):
+        authorization: Authorization = Validator().authorize(
+            user_id=user_id, password=password
+        )
+        if not authorization.user_exists:
             raise BackendError("Backend Error: User does not exist", "304")
-        if not Validator().check_password(user_id=user_id, password=password):
+        if not authorization.password_correct:
             raise BackendError("Backend Error: Password is incorrect", "305")
 
         if not file or not self.allowed_file(file.filename):
             raise BackendError("Backend Error: Invalid file type", "312")
 
-        filename = secure_filename(file.filename)
-        file_path = join(UPLOAD_FOLDER, filename)
-        file.save(file_path)
-
-        with db_operation() as data_cursor:
-            data_cursor.execute(
-                "UPDATE user SET image_path = ? WHERE uuid = ?;",
-                (file_path, user_id),
-            )
-
-        return file_path
+        return self.save_image(file, "user", user_id)
 
     def upload_task_image_control(
         self,
@@ -94,33 +119,25 @@ class ImageController:
         file,
     ) -> str:
         """Uploads the task image."""
-        if not Validator().check_user_exists(user_id=request_data["user_id"]):
+        authorization: Authorization = Validator().authorize(
+            user_id=request_data["user_id"],
+            password=request_data["password"],
+            group_id=request_data["group_id"],
+            task_id=request_data["task_id"],
+        )
+        if not authorization.user_exists:
             raise BackendError("Backend Error: User does not exist", "304")
-        if not Validator().check_password(
-            user_id=request_data["user_id"], password=request_data["password"]
-        ):
+        if not authorization.password_correct:
             raise BackendError("Backend Error: Password is incorrect", "305")
-        if not Validator().check_task_exists(task_id=request_data["task_id"]):
+        if not authorization.task_exists:
             raise BackendError("Backend Error: Task does not exist", "309")
-        if (request_data["group_id"] != "0") and not Validator().check_group_exists(
-            group_id=request_data["group_id"]
-        ):
+        if (request_data["group_id"] != "0") and not authorization.group_exists:
             raise BackendError("Backend Error: Group does not exist", "306")
 
         if not file or not self.allowed_file(file.filename):
             raise BackendError("Backend Error: Invalid file type", "312")
 
-        filename = secure_filename(file.filename)
-        file_path = join(UPLOAD_FOLDER, filename)
-        file.save(file_path)
-
-        with db_operation() as data_cursor:
-            data_cursor.execute(
-                "UPDATE task SET image_path = ? WHERE uuid = ?;",
-                (file_path, request_data["task_id"]),
-            )
-
-        return file_path
+        return self.save_image(file, "task", request_data["task_id"])
 
     def edit_user_image_control(
         self,
@@ -129,25 +146,18 @@ class ImageController:
         file,
     ) -> str:
         """Edits the user image."""
-        if not Validator().check_user_exists(user_id=user_id):
+        authorization: Authorization = Validator().authorize(
+            user_id=user_id, password=password
+        )
+        if not authorization.user_exists:
             raise BackendError("Backend Error: User does not exist", "304")
-        if not Validator().check_password(user_id=user_id, password=password):
+        if not authorization.password_correct:
             raise BackendError("Backend Error: Password is incorrect", "305")
 
         if not file or not self.allowed_file(file.filename):
             raise BackendError("Backend Error: Invalid file type", "312")
 
-        filename = secure_filename(file.filename)
-        file_path = join(UPLOAD_FOLDER, filename)
-        file.save(file_path)
-
-        with db_operation() as data_cursor:
-            data_cursor.execute(
-                "UPDATE user SET image_path = ? WHERE uuid = ?;",
-                (file_path, user_id),
-            )
-
-        return file_path
+        return self.save_image(file, "user", user_id)
 
     def edit_task_image_control(
         self,
@@ -155,33 +165,25 @@ class ImageController:
         file,
     ) -> str:
         """Edits the task image."""
-        if not Validator().check_user_exists(user_id=request_data["user_id"]):
+        authorization: Authorization = Validator().authorize(
+            user_id=request_data["user_id"],
+            password=request_data["password"],
+            group_id=request_data["group_id"],
+            task_id=request_data["task_id"],
+        )
+        if not authorization.user_exists:
             raise BackendError("Backend Error: User does not exist", "304")
-        if not Validator().check_password(
-            user_id=request_data["user_id"], password=request_data["password"]
-        ):
+        if not authorization.password_correct:
             raise BackendError("Backend Error: Password is incorrect", "305")
-        if not Validator().check_task_exists(task_id=request_data["task_id"]):
+        if not authorization.task_exists:
             raise BackendError("Backend Error: Task does not exist", "309")
-        if (request_data["group_id"] != "0") and not Validator().check_group_exists(
-            group_id=request_data["group_id"]
-        ):
+        if (request_data["group_id"] != "0") and not authorization.group_exists:
             raise BackendError("Backend Error: Group does not exist", "306")
 
         if not file or not self.allowed_file(file.filename):
             raise BackendError("Backend Error: Invalid file type", "312")
 
-        filename = secure_filename(file.filename)
-        file_path = join(UPLOAD_FOLDER, filename)
-        file.save(file_path)
-
-        with db_operation() as data_cursor:
-            data_cursor.execute(
-                "UPDATE task SET image_path = ? WHERE uuid = ?;",
-                (file_path, request_data["task_id"]),
-            )
-
-        return file_path
+        return self.save_image(file, "task", request_data["task_id"])
 
     def delete_user_image_control(
         self,
@@ -189,9 +191,12 @@ class ImageController:
         password: str,
     ) -> None:
         """Deletes the user image."""
-        if not Validator().check_user_exists(user_id=user_id):
+        authorization: Authorization = Validator().authorize(
+            user_id=user_id, password=password
+        )
+        if not authorization.user_exists:
             raise BackendError("Backend Error: User does not exist", "304")
-        if not Validator().check_password(user_id=user_id, password=password):
+        if not authorization.password_correct:
             raise BackendError("Backend Error: Password is incorrect", "305")
 
         with db_operation() as data_cursor:
@@ -200,41 +205,32 @@ class ImageController:
                 (user_id,),
             )
             result = data_cursor.fetchone()
-            if not result:
+            if not result or not result[0]:
                 raise BackendError("Backend Error: Image does not exist", "313")
-            remove(result[0])
-            try:
-                remove(result[0])
-            except FileNotFoundError as err:
-                raise BackendError(
-                    "Backend Error: Image does not exist", "313"
-                ) from err
-            except Exception as err:
-                raise BackendError(
-                    "Backend Error: Failed to delete image", "203"
-                ) from err
-
             data_cursor.execute(
                 "UPDATE user SET image_path = NULL WHERE uuid = ?;",
                 (user_id,),
             )
+        call_after_commit(remove_unreferenced_images)
 
     def delete_task_image_control(
         self,
         request_data: dict[str, Any],
     ) -> None:
         """Deletes the task image."""
-        if not Validator().check_user_exists(user_id=request_data["user_id"]):
+        authorization: Authorization = Validator().authorize(
+            user_id=request_data["user_id"],
+            password=request_data["password"],
+            group_id=request_data["group_id"],
+            task_id=request_data["task_id"],
+        )
+        if not authorization.user_exists:
             raise BackendError("Backend Error: User does not exist", "304")
-        if not Validator().check_password(
-            user_id=request_data["user_id"], password=request_data["password"]
-        ):
+        if not authorization.password_correct:
             raise BackendError("Backend Error: Password is incorrect", "305")
-        if not Validator().check_task_exists(task_id=request_data["task_id"]):
+        if not authorization.task_exists:
             raise BackendError("Backend Error: Task does not exist", "309")
-        if (request_data["group_id"] != "0") and not Validator().check_group_exists(
-            group_id=request_data["group_id"]
-        ):
+        if (request_data["group_id"] != "0") and not authorization.group_exists:
             raise BackendError("Backend Error: Group does not exist", "306")
 
         with db_operation() as data_cursor:
@@ -243,24 +239,13 @@ class ImageController:
                 (request_data["task_id"],),
             )
             result = data_cursor.fetchone()
-            if not result:
+            if not result or not result[0]:
                 raise BackendError("Backend Error: Image does not exist", "313")
-            remove(result[0])
-            try:
-                remove(result[0])
-            except FileNotFoundError as err:
-                raise BackendError(
-                    "Backend Error: Image does not exist", "313"
-                ) from err
-            except Exception as err:
-                raise BackendError(
-                    "Backend Error: Failed to delete image", "203"
-                ) from err
-
             data_cursor.execute(
                 "UPDATE task SET image_path = NULL WHERE uuid = ?;",
                 (request_data["task_id"],),
             )
+        call_after_commit(remove_unreferenced_images)
 
 
 if __name__ == "__main__":
@@ -2,11 +2,175 @@
 """This module handles the functions related toi invites for database."""
 
 from datetime import datetime, timezone
-from uuid import uuid4
+from os import environ
+from sqlite3 import Cursor
+from threading import Thread
+from time import sleep, time
+from typing import Any
 
+from controller_task import batch_error
 from error import BackendError
-from utils import db_operation
-from validator import Validator
+from log import make_new_log
+from utils import (
+    db_operation,
+    insert_many_with_new_ids,
+    insert_with_new_id,
+    locked_db_operation,
+    DEFAULT_DB_PATH,
+)
+from validator import (
+    INVITE_TTL,
+    LIVE_INVITE_CONDITION,
+    Authorization,
+    Validator,
+    invite_expiry,
+)
+
+# day_created keeps the ISO text clients read, created_at the unix time the
+# expiry compares.
+INVITE_INSERT_QUERY: str = (
+    "INSERT INTO group_invites "
+    "(invite_id, group_id, inviter_id, invitee_id, day_created, created_at) "
+    "VALUES (?, ?, ?, ?, ?, ?);"
+)
+
+# Deletes a live invite of a user and returns its group, and whether the
+# group still exists.
+TAKE_INVITE_QUERY: str = (
+    "DELETE FROM group_invites WHERE invite_id = ? AND invitee_id = ? "
+    f"AND {LIVE_INVITE_CONDITION} "
+    "RETURNING group_id, "
+    "EXISTS(SELECT 1 FROM task_group WHERE task_group.uuid = group_invites.group_id);"
+)
+# Withdraws the invite of one invitee to a group, whoever holds its invite_id.
+DELETE_INVITE_QUERY: str = (
+    "DELETE FROM group_invites WHERE invitee_id = ? AND group_id = ? "
+    "RETURNING invite_id;"
+)
+# Adds a user to a group unless the user is already a member.
+JOIN_GROUP_QUERY: str = (
+    "INSERT INTO group_user (group_id, user_id, role_id) SELECT ?, ?, 'member' "
+    "WHERE NOT EXISTS(SELECT 1 FROM group_user WHERE group_id = ? AND user_id = ?);"
+)
+
+# The sweeper deletes expired invites in batches of this many rows, one
+# short transaction each, so it never holds the write lock for long.
+INVITE_SWEEP_BATCH: int = 500
+INVITE_SWEEP_INTERVAL: float = (
+    float(environ.get("ROOMIEBUDDY_INVITE_SWEEP_MINUTES", "60")) * 60
+)
+
+# The live invites a user received, with the group and inviter names joined in.
+PENDING_INVITES_QUERY: str = (
+    "SELECT group_invites.invite_id, group_invites.group_id, task_group.name, "
+    "group_invites.inviter_id, user.username "
+    "FROM group_invites "
+    "LEFT JOIN task_group ON task_group.uuid = group_invites.group_id "
+    "LEFT JOIN user ON user.uuid = group_invites.inviter_id "
+    f"WHERE group_invites.invitee_id = ? AND {LIVE_INVITE_CONDITION};"
+)
+
+
+# The live invites sent for a group, with the inviter and invitee names joined in.
+# Pages continue after the last invite id of the previous page.
+SENT_INVITES_QUERY: str = (
+    "SELECT group_invites.invite_id, group_invites.inviter_id, inviter.username, "
+    "group_invites.invitee_id, invitee.username, group_invites.day_created "
+    "FROM group_invites "
+    "LEFT JOIN user AS inviter ON inviter.uuid = group_invites.inviter_id "
+    "LEFT JOIN user AS invitee ON invitee.uuid = group_invites.invitee_id "
+    f"WHERE group_invites.group_id = ? AND {LIVE_INVITE_CONDITION}"
+)
+
+DEFAULT_INVITE_PAGE_SIZE: int = 100
+MAX_INVITE_PAGE_SIZE: int = 500
+MAX_INVITEES: int = 500
+
+
+def sent_invite_page(after: str | None, limit: int | None) -> tuple[str, tuple]:
+    """Makes the end of SENT_INVITES_QUERY for a page and its parameters.
+
+    One row more than the page is fetched, to know if another page follows.
+    """
+    condition: str = " AND group_invites.invite_id > ?" if after else ""
+    params: tuple = (after,) if after else ()
+    if limit is None:
+        return f"{condition} ORDER BY group_invites.invite_id;", params
+    return f"{condition} ORDER BY group_invites.invite_id LIMIT ?;", (*params, limit + 1)
+
+
+def invite_row_to_dict(invite: tuple) -> dict[str, str]:
+    """Maps a row of PENDING_INVITES_QUERY to the invite sent to the client."""
+    return {
+        "invite_id": invite[0],
+        "group_id": invite[1],
+        "group_name": invite[2] or "Unknown Group",
+        "inviter_id": invite[3],
+        "inviter_name": invite[4] or "Unknown User",
+    }
+
+
+def sent_invite_row_to_dict(invite: tuple) -> dict[str, str]:
+    """Maps a row of SENT_INVITES_QUERY to the invite sent to the client."""
+    return {
+        "invite_id": invite[0],
+        "inviter_id": invite[1],
+        "inviter_name": invite[2] or "Unknown User",
+        "invitee_id": invite[3],
+        "invitee_name": invite[4] or "Unknown User",
+        "created_at": invite[5],
+    }
+
+
+def sweep_invite_batch(data_cursor: Cursor, expired: float, batch_size: int) -> int:
+    """Deletes one batch of invites created before expired, returns how many."""
+    data_cursor.execute(
+        "DELETE FROM group_invites WHERE rowid IN "
+        "(SELECT rowid FROM group_invites WHERE created_at < ? LIMIT ?);",
+        (expired, batch_size),
+    )
+    return data_cursor.rowcount
+
+
+def sweep_expired_invites(
+    db_name: str = DEFAULT_DB_PATH,
+    ttl: float = INVITE_TTL,
+    batch_size: int = INVITE_SWEEP_BATCH,
+    pause: float = 0.05,
+) -> int:
+    """Deletes the invites older than ttl and returns how many were deleted.
+
+    Rows the migration backfill has not dated yet are left for a later sweep.
+    """
+    if ttl <= 0:
+        return 0
+    expired: float = time() - ttl
+    deleted: int = 0
+    while True:
+        with locked_db_operation(db_name) as data_cursor:
+            swept: int = sweep_invite_batch(data_cursor, expired, batch_size)
+        deleted += swept
+        if swept < batch_size:
+            return deleted
+        sleep(pause)
+
+
+def start_invite_sweeper(
+    db_name: str = DEFAULT_DB_PATH, interval: float = INVITE_SWEEP_INTERVAL
+) -> Thread:
+    """Sweeps the expired invites in the background every interval seconds."""
+
+    def run() -> None:
+        while True:
+            try:
+                sweep_expired_invites(db_name)
+            except Exception as err:
+                make_new_log("start_invite_sweeper", err)
+            sleep(interval)
+
+    sweeper_thread: Thread = Thread(target=run, name="invite_sweeper", daemon=True)
+    sweeper_thread.start()
+    return sweeper_thread
 
 
 class InviteController:
@@ -20,209 +184,266 @@ class InviteController:
         self, inviter_id: str, invitee_id: str, group_id: str, password: str
     ) -> str:
         """This will invite a user to a group"""
-        if not Validator().check_user_exists(user_id=inviter_id):
+        inviter: Authorization = Validator().authorize(
+            user_id=inviter_id, password=password, group_id=group_id
+        )
+        # The invitee only needs to exist and not be a member yet.
+        invitee: Authorization = Validator().authorize(
+            user_id=invitee_id, password="", group_id=group_id
+        )
+        if not inviter.user_exists:
             raise BackendError("Backend Error: Inviter does not exist", "304")
-        if not Validator().check_password(user_id=inviter_id, password=password):
+        if not inviter.password_correct:
             raise BackendError("Backend Error: Password is incorrect", "305")
-        if not Validator().check_user_exists(user_id=invitee_id):
+        if not invitee.user_exists:
             raise BackendError("Backend Error: Invitee does not exist", "304")
-        if not Validator().check_group_exists(group_id=group_id):
+        if not inviter.group_exists:
             raise BackendError("Backend Error: Group does not exist", "306")
-        if not Validator().check_user_in_group(user_id=inviter_id, group_id=group_id):
+        if not inviter.in_group:
             raise BackendError("Backend Error: Inviter is not in the group", "310")
-        if Validator().check_user_in_group(user_id=invitee_id, group_id=group_id):
+        if invitee.in_group:
             raise BackendError("Backend Error: Invitee is already in the group", "307")
         if Validator().check_invite(invitee_id, group_id):
             raise BackendError("Backend Error: Invitee already has an invite.", "311")
 
         # Create invitation
-        invite_id: str = str(uuid4())
-        while Validator().check_duplicate_id("invite", invite_id):
-            invite_id = str(uuid4())
-        day_created: str = datetime.now(timezone.utc).isoformat()
+        created: datetime = datetime.now(timezone.utc)
 
         with db_operation() as data_cursor:
-            data_cursor.execute(
-                "INSERT INTO group_invites VALUES (?, ?, ?, ?, ?);",
-                (invite_id, group_id, inviter_id, invitee_id, day_created),
+            invite_id: str = insert_with_new_id(
+                data_cursor,
+                INVITE_INSERT_QUERY,
+                lambda new_invite_id: (
+                    new_invite_id,
+                    group_id,
+                    inviter_id,
+                    invitee_id,
+                    created.isoformat(),
+                    created.timestamp(),
+                ),
             )
         return invite_id
 
+    def create_invites_control(
+        self, inviter_id: str, group_id: str, password: str, invitees: list[Any]
+    ) -> list[dict[str, Any]]:
+        """This will invite many users, by id or email, to a group at once.
+
+        The invitees, their memberships and their invites are looked up with
+        one query each and every new invite is written with executemany.
+        Each invitee gets its own result, in the order of the list.
+        """
+        authorization: Authorization = Validator().authorize(
+            user_id=inviter_id, password=password, group_id=group_id
+        )
+        if not authorization.user_exists:
+            raise BackendError("Backend Error: Inviter does not exist", "304")
+        if not authorization.password_correct:
+            raise BackendError("Backend Error: Password is incorrect", "305")
+        if not authorization.group_exists:
+            raise BackendError("Backend Error: Group does not exist", "306")
+        if not authorization.in_group:
+            raise BackendError("Backend Error: Inviter is not in the group", "310")
+        if not isinstance(invitees, list) or not all(
+            isinstance(invitee, str) and invitee for invitee in invitees
+        ):
+            raise BackendError("Backend Error: Invitees must be a list of ids or emails", "103")
+        if len(invitees) > MAX_INVITEES:
+            raise BackendError(
+                f"Backend Error: At most {MAX_INVITEES} invitees at once", "104"
+            )
+        results: list[dict[str, Any]] = [
+            {"invitee": invitee, "error_no": "0", "message": "success"}
+            for invitee in invitees
+        ]
+        if not invitees:
+            return results
+        created: datetime = datetime.now(timezone.utc)
+        values: tuple[str, ...] = tuple(dict.fromkeys(invitees))
+        marks: str = ", ".join("?" * len(values))
+        with db_operation() as data_cursor:
+            data_cursor.execute(
+                f"SELECT uuid, email FROM user WHERE uuid IN ({marks}) OR email IN ({marks});",
+                (*values, *values),
+            )
+            user_ids: dict[str, str] = {}
+            for user_id, email in data_cursor.fetchall():
+                user_ids[user_id] = user_id
+                user_ids[email] = user_id
+            found: tuple[str, ...] = tuple(set(user_ids.values()))
+            found_marks: str = ", ".join("?" * len(found))
+            data_cursor.execute(
+                "SELECT user_id FROM group_user "
+                f"WHERE group_id = ? AND user_id IN ({found_marks});",
+                (group_id, *found),
+            )
+            members: set[str] = {row[0] for row in data_cursor.fetchall()}
+            data_cursor.execute(
+                "SELECT invitee_id FROM group_invites "
+                f"WHERE group_id = ? AND invitee_id IN ({found_marks}) "
+                f"AND {LIVE_INVITE_CONDITION};",
+                (group_id, *found, invite_expiry()),
+            )
+            invited: set[str] = {row[0] for row in data_cursor.fetchall()}
+            # The parameters of every new invite but its id, and its result.
+            inserts: list[tuple] = []
+            created_results: list[dict[str, Any]] = []
+            for result in results:
+                invitee_id: str | None = user_ids.get(result["invitee"])
+                if invitee_id is None:
+                    error: BackendError = BackendError(
+                        "Backend Error: Invitee does not exist", "304"
+                    )
+                elif invitee_id in members:
+                    error = BackendError(
+                        "Backend Error: Invitee is already in the group", "307"
+                    )
+                elif invitee_id in invited:
+                    error = BackendError(
+                        "Backend Error: Invitee already has an invite.", "311"
+                    )
+                else:
+                    invited.add(invitee_id)
+                    result["invitee_id"] = invitee_id
+                    created_results.append(result)
+                    inserts.append(
+                        (
+                            group_id,
+                            inviter_id,
+                            invitee_id,
+                            created.isoformat(),
+                            created.timestamp(),
+                        )
+                    )
+                    continue
+                result.update(batch_error(error))
+            for result, invite_id in zip(
+                created_results,
+                insert_many_with_new_ids(data_cursor, INVITE_INSERT_QUERY, inserts),
+            ):
+                result["invite_id"] = invite_id
+        return results
+
     def get_pending_control(
         self,
         user_id: str,
         password: str,
     ) -> dict[str, dict]:
         """Gets all pending invites for a user"""
-        if not Validator().check_user_exists(user_id=user_id):
+        authorization: Authorization = Validator().authorize(
+            user_id=user_id, password=password
+        )
+        if not authorization.user_exists:
             raise BackendError("Backend Error: User does not exist", "304")
-        if not Validator().check_password(user_id, password):
+        if not authorization.password_correct:
             raise BackendError("Backend Error: Password is incorrect", "305")
-        invites: dict[str, dict] = {}
         with db_operation() as data_cursor:
-            # 1. Fetch all raw invite data
-            data_cursor.execute(
-                "SELECT invite_id, inviter_id, group_id "
-                "FROM group_invites WHERE invitee_id = ?;",
-                (user_id,),
-            )
-            invites_data: list[tuple] = data_cursor.fetchall()
-
-            if not invites_data:
-                return {}
-
-            # 2. Collect unique IDs
-            group_ids = {item[2] for item in invites_data}
-            inviter_ids = {item[1] for item in invites_data}
-
-            # 3. Fetch group names
-            group_names: dict[str, str] = {}
-            if group_ids:
-                group_placeholders = ",".join("?" * len(group_ids))
-                data_cursor.execute(
-                    f"SELECT uuid, name FROM task_group WHERE uuid IN ({group_placeholders});",
-                    list(group_ids),
-                )
-                group_names = dict(data_cursor.fetchall())
-
-            # 4. Fetch inviter names
-            inviter_names: dict[str, str] = {}
-            if inviter_ids:
-                inviter_placeholders = ",".join("?" * len(inviter_ids))
-                data_cursor.execute(
-                    f"SELECT uuid, username FROM user WHERE uuid IN ({inviter_placeholders});",
-                    list(inviter_ids),
-                )
-                inviter_names = dict(data_cursor.fetchall())
-
-            # 5. Build the final result dictionary
-            for invite_item in invites_data:
-                invite_id: str = invite_item[0]
-                inviter_id: str = invite_item[1]
-                group_id: str = invite_item[2]
-
-                # Look up names from the fetched dictionaries
-                group_name: str = group_names.get(group_id, "Unknown Group")
-                inviter_name: str = inviter_names.get(inviter_id, "Unknown User")
-
-                invites[invite_id] = {
-                    "invite_id": invite_id,
-                    "group_id": group_id,
-                    "group_name": group_name,
-                    "inviter_id": inviter_id,
-                    "inviter_name": inviter_name,
-                }
-
-        return invites
+            data_cursor.execute(PENDING_INVITES_QUERY, (user_id, invite_expiry()))
+            invite_list: list[tuple] = data_cursor.fetchall()
+        return {invite[0]: invite_row_to_dict(invite) for invite in invite_list}
 
     def sent_invite_control(
         self,
         user_id: str,
         group_id: str,
         password: str,
-    ) -> dict[str, dict]:
-        """Checks what invites has group sent."""
-        if not Validator().check_user_exists(user_id=user_id):
+        after: str | None = None,
+        limit: int | None = None,
+    ) -> dict[str, Any]:
+        """Checks what invites has group sent.
+
+        The invites are keyed by id, order lists the ids in page order and
+        next_cursor, None on the last page, is the after of the next page.
+        Without after and limit every invite comes at once.
+        """
+        authorization: Authorization = Validator().authorize(
+            user_id=user_id, password=password, group_id=group_id
+        )
+        if not authorization.user_exists:
             raise BackendError("Backend Error: User does not exist", "304")
-        if not Validator().check_password(user_id, password):
+        if not authorization.password_correct:
             raise BackendError("Backend Error: Password is incorrect", "305")
-        if not Validator().check_group_exists(group_id=group_id):
+        if not authorization.group_exists:
             raise BackendError("Backend Error: Group does not exist", "306")
-        if not Validator().check_user_in_group(user_id=user_id, group_id=group_id):
+        if not authorization.in_group:
             raise BackendError("Backend Error: User is not in the group", "310")
-        invites: dict[str, dict] = {}
+        if limit is not None:
+            limit = max(1, min(limit, MAX_INVITE_PAGE_SIZE))
+        elif after:
+            limit = DEFAULT_INVITE_PAGE_SIZE
+        page, page_params = sent_invite_page(after, limit)
         with db_operation() as data_cursor:
             data_cursor.execute(
-                (
-                    "SELECT invite_id, inviter_id, invitee_id, created_at "
-                    "FROM group_invites WHERE group_id = ?;"
-                ),
-                (group_id,),
+                SENT_INVITES_QUERY + page, (group_id, invite_expiry(), *page_params)
             )
-            invites_data: list[tuple] = data_cursor.fetchall()
-            for invite_item in invites_data:
-                invite_id: str = invite_item[0]
-                inviter_id: str = invite_item[1]
-                invitee_id: str = invite_item[2]
-                created_at: str = invite_item[3]
-                data_cursor.execute(
-                    "SELECT username FROM user WHERE uuid = ?;",
-                    (invitee_id),
-                )
-                invitee_name: str = data_cursor.fetchone()[0]
-                data_cursor.execute(
-                    "SELECT name FROM user WHERE uuid = ?;",
-                    (inviter_id),
-                )
-                inviter_name: str = data_cursor.fetchone()[0]
-                invites[invite_id] = {
-                    "invite_id": invite_id,
-                    "inviter_id": inviter_id,
-                    "inviter_name": inviter_name,
-                    "invitee_id": invitee_id,
-                    "invitee_name": invitee_name,
-                    "created_at": created_at,
-                }
-        return invites
+            invite_list: list[tuple] = data_cursor.fetchall()
+        next_cursor: str | None = None
+        if limit is not None and len(invite_list) > limit:
+            invite_list = invite_list[:limit]
+            next_cursor = invite_list[-1][0]
+        return {
+            "invites": {invite[0]: sent_invite_row_to_dict(invite) for invite in invite_list},
+            "order": [invite[0] for invite in invite_list],
+            "next_cursor": next_cursor,
+        }
 
     def respond_invite_control(
         self,
         user_id: str,
-        group_id: str,
+        invite_id: str,
         password: str,
         accept: bool = True,
     ) -> None:
-        """Accepts an invite"""
-        if not Validator().check_user_exists(user_id=user_id):
+        """Accepts or declines an invite of the user.
+
+        Taking the invite and joining the group are the only two statements,
+        both in the transaction of the request.
+        """
+        authorization: Authorization = Validator().authorize(
+            user_id=user_id, password=password
+        )
+        if not authorization.user_exists:
             raise BackendError("Backend Error: User does not exist", "304")
-        if not Validator().check_password(user_id, password):
+        if not authorization.password_correct:
             raise BackendError("Backend Error: Password is incorrect", "305")
-        if not Validator().check_group_exists(group_id=group_id):
-            raise BackendError("Backend Error: Group does not exist", "306")
-        if not Validator().check_invite(invitee_id=user_id, group_id=group_id):
-            raise BackendError("Backend Error: Invite does not exist", "308")
         with db_operation() as data_cursor:
             data_cursor.execute(
-                "SELECT invite_id FROM group_invites WHERE group_id = ?;",
-                (group_id,),
+                TAKE_INVITE_QUERY, (invite_id, user_id, invite_expiry())
             )
-            invite_id: str = data_cursor.fetchone()[0]
+            invite: tuple | None = data_cursor.fetchone()
+            if invite is None:
+                raise BackendError("Backend Error: Invite does not exist", "308")
+            group_id, group_exists = invite
             if accept:
+                if not group_exists:
+                    raise BackendError("Backend Error: Group does not exist", "306")
                 data_cursor.execute(
-                    "INSERT INTO group_user VALUES (?, ?, ?);",
-                    (group_id, user_id, "member"),
+                    JOIN_GROUP_QUERY, (group_id, user_id, group_id, user_id)
                 )
-            data_cursor.execute(
-                "DELETE FROM group_invites WHERE invite_id = ?;",
-                (invite_id,),
-            )
+        if accept:
+            Validator().invalidate_membership(user_id)
 
     def delete_invite_control(
         self, user_id: str, invitee_id: str, group_id: str, password: str
     ) -> None:
         """Deletes an invite"""
-        if not Validator().check_user_exists(user_id=user_id):
+        authorization: Authorization = Validator().authorize(
+            user_id=user_id, password=password, group_id=group_id
+        )
+        if not authorization.user_exists:
             raise BackendError("Backend Error: Inviter does not exist", "304")
-        if not Validator().check_password(user_id=user_id, password=password):
+        if not authorization.password_correct:
             raise BackendError("Backend Error: Password is incorrect", "305")
         if not Validator().check_user_exists(user_id=invitee_id):
             raise BackendError("Backend Error: Invitee does not exist", "304")
-        if not Validator().check_group_exists(group_id=group_id):
+        if not authorization.group_exists:
             raise BackendError("Backend Error: Group does not exist", "306")
-        if not Validator().check_user_in_group(user_id=user_id, group_id=group_id):
+        if not authorization.in_group:
             raise BackendError("Backend Error: Inviter is not in the group", "310")
-        if not Validator().check_invite(invitee_id=invitee_id, group_id=group_id):
-            raise BackendError("Backend Error: Invite does not exist", "308")
         with db_operation() as data_cursor:
-            data_cursor.execute(
-                "SELECT invite_id FROM group_invites WHERE group_id = ?;",
-                (group_id,),
-            )
-            invite_id: str = data_cursor.fetchone()[0]
-            data_cursor.execute(
-                "DELETE FROM group_invites WHERE invite_id = ?;",
-                (invite_id,),
-            )
+            data_cursor.execute(DELETE_INVITE_QUERY, (invitee_id, group_id))
+            if not data_cursor.fetchall():
+                raise BackendError("Backend Error: Invite does not exist", "308")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,139 @@
+# coding: utf-8
+"""This module handles the login sessions for database."""
+
+from hashlib import sha256
+from secrets import token_urlsafe
+from time import time
+
+from cache import LRUCache
+from log import make_new_log
+from utils import (
+    call_after_commit,
+    call_after_rollback,
+    db_operation,
+    locked_db_operation,
+)
+
+SESSION_TTL: float = 30 * 24 * 3600
+# Sliding expiry is only written back once the session is this much older,
+# so a busy client does not turn every request into a write.
+SESSION_REFRESH: float = 24 * 3600
+SESSION_CACHE_SIZE: int = 10000
+# A session revoked by another process is still accepted for this long.
+SESSION_CACHE_TTL: float = 60.0
+
+# Token hash -> (user id, expiry timestamp), in front of the session table.
+SESSION_CACHE: LRUCache = LRUCache(max_size=SESSION_CACHE_SIZE, ttl=SESSION_CACHE_TTL)
+
+
+def hash_token(token: str) -> str:
+    """Hashes a token, only the hash is ever stored."""
+    return sha256(token.encode("utf-8")).hexdigest()
+
+
+def write_session(token_hash: str, expires_at: float | None) -> None:
+    """Extends a session, or deletes it when expires_at is None.
+
+    Authenticating runs in requests that may only read, so the write gets
+    a transaction of its own once the request is done. A failed write is
+    only logged, the session keeps its old expiry.
+    """
+    try:
+        with locked_db_operation() as data_cursor:
+            if expires_at is None:
+                data_cursor.execute(
+                    "DELETE FROM session WHERE token_hash = ?;", (token_hash,)
+                )
+            else:
+                data_cursor.execute(
+                    "UPDATE session SET expires_at = ? WHERE token_hash = ?;",
+                    (expires_at, token_hash),
+                )
+    except Exception as err:
+        make_new_log("write_session", err)
+
+
+class SessionController:
+    """This class handles the session functions for the database."""
+
+    def __init__(self) -> None:
+        """Initialize the SessionController class."""
+        return
+
+    def create_session_control(self, user_id: str) -> dict[str, str | float]:
+        """Creates a session and returns its token and expiry."""
+        token: str = token_urlsafe(32)
+        token_hash: str = hash_token(token)
+        now: float = time()
+        expires_at: float = now + SESSION_TTL
+        with db_operation() as data_cursor:
+            data_cursor.execute(
+                "DELETE FROM session WHERE user_id = ? AND expires_at < ?;",
+                (user_id, now),
+            )
+            data_cursor.execute(
+                "INSERT INTO session (token_hash, user_id, expires_at) VALUES (?, ?, ?);",
+                (token_hash, user_id, expires_at),
+            )
+        SESSION_CACHE.put(token_hash, (user_id, expires_at))
+        return {"token": token, "expires_at": expires_at}
+
+    def authenticate_session_control(self, token: str) -> str | None:
+        """Gets the user of a live session, extending it, or None."""
+        token_hash: str = hash_token(token)
+        now: float = time()
+        cached: tuple[str, float] | None = SESSION_CACHE.get(token_hash)
+        from_cache: bool = cached is not None
+        if cached is None:
+            with db_operation() as data_cursor:
+                data_cursor.execute(
+                    "SELECT user_id, expires_at FROM session WHERE token_hash = ?;",
+                    (token_hash,),
+                )
+                cached = data_cursor.fetchone()
+            if cached is None:
+                return None
+        user_id, expires_at = cached
+        if expires_at < now:
+            SESSION_CACHE.pop(token_hash)
+            # The request fails with 315 and rolls back, so the delete must
+            # run either way.
+            call_after_commit(lambda: write_session(token_hash, None))
+            call_after_rollback(lambda: write_session(token_hash, None))
+            return None
+        if expires_at < now + SESSION_TTL - SESSION_REFRESH:
+            expires_at = now + SESSION_TTL
+            refreshed: float = expires_at
+            call_after_commit(lambda: write_session(token_hash, refreshed))
+        elif from_cache:
+            # A hit must not renew the entry, or a session revoked elsewhere
+            # would stay cached for as long as it is used.
+            return user_id
+        SESSION_CACHE.put(token_hash, (user_id, expires_at))
+        return user_id
+
+    def revoke_session_control(self, token: str) -> None:
+        """Ends a single session."""
+        token_hash: str = hash_token(token)
+        SESSION_CACHE.pop(token_hash)
+        with db_operation() as data_cursor:
+            data_cursor.execute(
+                "DELETE FROM session WHERE token_hash = ?;", (token_hash,)
+            )
+        # A request reading the old snapshot may have cached it again.
+        call_after_commit(lambda: SESSION_CACHE.pop(token_hash))
+
+    def revoke_user_sessions_control(self, user_id: str) -> None:
+        """Ends every session of a user."""
+        SESSION_CACHE.pop_where(lambda _token_hash, entry: entry[0] == user_id)
+        with db_operation() as data_cursor:
+            data_cursor.execute("DELETE FROM session WHERE user_id = ?;", (user_id,))
+        call_after_commit(
+            lambda: SESSION_CACHE.pop_where(
+                lambda _token_hash, entry: entry[0] == user_id
+            )
+        )
+
+
+if __name__ == "__main__":
+    print("This module is not intended to be run directly.")
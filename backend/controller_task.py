@@ -1,16 +1,333 @@
 # coding: utf-8
 """This module controls the task data between the sqlite database."""
 
-from os import remove
-from os.path import exists
-
+from base64 import urlsafe_b64decode, urlsafe_b64encode
 from datetime import datetime
-from typing import Any
-from uuid import uuid4
+from functools import lru_cache
+from hashlib import sha256
+from json import dumps, loads
+from sqlite3 import Cursor
+from time import time
+from typing import Any, Callable
 
 from error import BackendError
-from utils import db_operation
-from validator import Validator
+from image_store import remove_unreferenced_images
+from utils import (
+    call_after_commit,
+    db_operation,
+    insert_many_with_new_ids,
+    insert_with_new_id,
+)
+from validator import Authorization, Validator
+
+# Every task listing selects these columns so task_row_to_dict can map them,
+# the usernames are joined in instead of being looked up per task.
+TASK_LISTING_QUERY: str = (
+    "SELECT task.uuid, task.name, task.description, task.due, task.est_day, "
+    "task.est_hour, task.est_min, task.assigner_uuid, assigner.username, "
+    "task.assign_uuid, assignee.username, task.group_uuid, task.completed, "
+    "task.priority, task.recursive, task.image_path, task.updated_at "
+    "FROM task "
+    "LEFT JOIN user AS assigner ON assigner.uuid = task.assigner_uuid "
+    "LEFT JOIN user AS assignee ON assignee.uuid = task.assign_uuid "
+)
+
+
+def task_row_to_dict(task: tuple) -> dict[str, Any]:
+    """Maps a row of TASK_LISTING_QUERY to the task sent to the client."""
+    return {
+        "name": task[1],
+        "description": task[2],
+        "due_timestamp": float(task[3] or 0),
+        "est_day": int(task[4] or 0),
+        "est_hour": int(task[5] or 0),
+        "est_min": int(task[6] or 0),
+        "assigner_id": task[7],
+        "assigner_username": task[8] or "Unknown",
+        "assign_id": task[9],
+        "assignee_username": task[10] or "Unknown",
+        "group_id": task[11],
+        "completed": bool(task[12]),
+        "priority": int(task[13] or 0),
+        "recursive": int(task[14] or 0),
+        "image_path": task[15] or "",
+        "updated_at": float(task[16] or 0),
+    }
+
+
+def task_window(
+    due_from: float | None, due_to: float | None, include_completed: bool
+) -> tuple[str, tuple]:
+    """Makes the conditions limiting a task listing to a due window.
+
+    The window includes due_from and excludes due_to, so consecutive months
+    never share a task. The conditions start with AND and come with their
+    parameters.
+    """
+    conditions: list[str] = []
+    params: list[float] = []
+    if due_from is not None:
+        conditions.append("task.due >= ?")
+        params.append(due_from)
+    if due_to is not None:
+        conditions.append("task.due < ?")
+        params.append(due_to)
+    if not include_completed:
+        conditions.append("task.completed = 0")
+    return "".join(f" AND {condition}" for condition in conditions), tuple(params)
+
+
+# Sort name -> (column, direction, index of the column in a listing row).
+# Each sort is served by a (group_uuid or assign_uuid, column, uuid) index.
+TASK_SORTS: dict[str, tuple[str, str, int]] = {
+    "due": ("task.due", "ASC", 3),
+    "priority": ("task.priority", "DESC", 13),
+    "name": ("task.name", "ASC", 1),
+}
+DEFAULT_PAGE_SIZE: int = 100
+MAX_PAGE_SIZE: int = 500
+
+
+def make_page_cursor(sort: str, task: tuple) -> str:
+    """Makes the opaque cursor pointing after a listing row."""
+    position: str = dumps([sort, task[TASK_SORTS[sort][2]], task[0]])
+    return urlsafe_b64encode(position.encode("utf-8")).decode("ascii")
+
+
+def read_page_cursor(sort: str, after: str) -> tuple[Any, str]:
+    """Gets the sort value and task id a cursor points after."""
+    try:
+        cursor_sort, value, task_id = loads(urlsafe_b64decode(after.encode("ascii")))
+    except Exception as err:
+        raise BackendError("Backend Error: The after cursor is invalid", "103") from err
+    if cursor_sort != sort:
+        raise BackendError(
+            "Backend Error: The after cursor belongs to another sort", "103"
+        )
+    return value, task_id
+
+
+def task_page(
+    sort: str, after: str | None, limit: int | None
+) -> tuple[str, str, tuple]:
+    """Makes the keyset condition and the ordering of a page of tasks.
+
+    The condition starts with AND and the ordering asks for one row more
+    than the limit to tell whether a next page exists. Without a limit the
+    ordering covers the whole listing.
+    """
+    column, direction, _ = TASK_SORTS[sort]
+    condition: str = ""
+    params: tuple = ()
+    if after:
+        comparison: str = ">" if direction == "ASC" else "<"
+        condition = f" AND ({column}, task.uuid) {comparison} (?, ?)"
+        params = read_page_cursor(sort, after)
+    order: str = f" ORDER BY {column} {direction}, task.uuid {direction}"
+    if limit is not None:
+        order += " LIMIT ?"
+        params += (limit + 1,)
+    return condition, order, params
+
+
+# The sync columns are filled by triggers, so inserts name their columns.
+TASK_INSERT_QUERY: str = (
+    "INSERT INTO task (uuid, name, description, due, est_day, est_hour, "
+    "est_min, assigner_uuid, assign_uuid, group_uuid, completed, priority, "
+    "recursive, image_path) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);"
+)
+
+
+def completed_flag(value: Any) -> int:
+    """Converts a completed field, which must be 0 or 1."""
+    if value not in (0, 1, "0", "1", True, False):
+        raise ValueError(f"completed must be 0 or 1, not {value!r}")
+    return int(value)
+
+
+# Request field -> (task column, conversion) for the fields an edit may set.
+TASK_FIELDS: dict[str, tuple[str, Callable[[Any], Any]]] = {
+    "task_name": ("name", str),
+    "task_description": ("description", str),
+    "task_est_day": ("est_day", int),
+    "task_est_hour": ("est_hour", int),
+    "task_est_min": ("est_min", int),
+    "assign_id": ("assign_uuid", str),
+    "group_id": ("group_uuid", str),
+    "completed": ("completed", completed_flag),
+    "priority": ("priority", int),
+    "recursive": ("recursive", int),
+}
+DUE_FIELDS: tuple[str, ...] = (
+    "task_due_year",
+    "task_due_month",
+    "task_due_date",
+    "task_due_hour",
+    "task_due_min",
+)
+MAX_BATCH_SIZE: int = 500
+
+
+def task_due(request_data: dict[str, Any]) -> float:
+    """Gets the due timestamp from the date fields of a request."""
+    return datetime(
+        int(request_data.get("task_due_year", "2000")),
+        int(request_data.get("task_due_month", "1")),
+        int(request_data.get("task_due_date", "1")),
+        int(request_data.get("task_due_hour", "0")),
+        int(request_data.get("task_due_min", "0")),
+        0,
+    ).timestamp()
+
+
+def task_insert_params(task_id: str, request_data: dict[str, Any]) -> tuple:
+    """Makes the TASK_INSERT_QUERY parameters of a new task."""
+    return (
+        task_id,
+        request_data["task_name"],
+        request_data.get("task_description", ""),
+        task_due(request_data),
+        int(request_data.get("task_est_day", "1")),
+        int(request_data.get("task_est_hour", "0")),
+        int(request_data.get("task_est_min", "0")),
+        request_data["assigner_id"],
+        request_data["assign_id"],
+        request_data["group_id"],
+        0,  # completed = 0
+        int(request_data.get("priority", "0")),
+        int(request_data.get("recursive", "0")),
+        "",  # image_path = ""
+    )
+
+
+def task_changes(request_data: dict[str, Any]) -> dict[str, Any]:
+    """Gets the columns an edit sets, only for the fields it carries.
+
+    The due date is stored as one timestamp, so an edit of it must carry
+    every due field, a part left out would otherwise reset to its default.
+    """
+    given_due: list[str] = [field for field in DUE_FIELDS if field in request_data]
+    if given_due and len(given_due) < len(DUE_FIELDS):
+        missing: str = ", ".join(field for field in DUE_FIELDS if field not in given_due)
+        raise BackendError(
+            f"Backend Error: A due date edit needs every due field, missing {missing}",
+            "110",
+        )
+    try:
+        changes: dict[str, Any] = {
+            column: convert(request_data[field])
+            for field, (column, convert) in TASK_FIELDS.items()
+            if field in request_data
+        }
+        if given_due:
+            changes["due"] = task_due(request_data)
+    except (TypeError, ValueError) as err:
+        raise BackendError("Backend Error: A field has the wrong type", "103") from err
+    return changes
+
+
+# Matches the tasks a user may change: those of the groups of the user and
+# those assigned by or to the user. Takes the user id twice.
+TASK_CHANGE_GUARD: str = (
+    "(group_uuid IN (SELECT group_id FROM group_user WHERE user_id = ?) "
+    "OR ? IN (assigner_uuid, assign_uuid))"
+)
+
+
+@lru_cache(maxsize=256)
+def task_update_query(columns: tuple[str, ...], guarded: bool = False) -> str:
+    """Makes the UPDATE setting the given columns of one task.
+
+    Edits setting the same columns share the statement, and its prepared
+    form in the statement cache of the connection. A guarded UPDATE takes
+    the user id twice more and only touches a task the user may change.
+    """
+    assignments: str = ", ".join(f"{column} = ?" for column in columns)
+    guard: str = f" AND {TASK_CHANGE_GUARD}" if guarded else ""
+    return f"UPDATE task SET {assignments} WHERE uuid = ?{guard};"
+
+
+@lru_cache(maxsize=64)
+def complete_task_query(task_count: int) -> str:
+    """Makes the UPDATE setting completed on the tasks of a user among some ids."""
+    return (
+        "UPDATE task SET completed = ? "
+        f"WHERE uuid IN ({', '.join('?' * task_count)}) AND {TASK_CHANGE_GUARD};"
+    )
+
+
+def batch_error(err: BackendError) -> dict[str, str]:
+    """Makes the result of a batch item that was refused."""
+    return {"error_no": err.error_code, "message": err.message}
+
+
+# Tombstones are dropped after this long, older sync cursors start over.
+TOMBSTONE_TTL: float = 30 * 24 * 3600
+
+
+def sync_scope(table: str, group_count: int) -> str:
+    """Makes the condition matching the rows a user sees changed after a version.
+
+    Each branch matches one of the (column, row_version) indexes.
+    """
+    groups: str = ", ".join("?" * group_count)
+    return (
+        f"(({table}.group_uuid IN ({groups}) AND {table}.row_version > ?) "
+        f"OR ({table}.assign_uuid = ? AND {table}.row_version > ?))"
+    )
+
+
+def sync_task_query(group_count: int) -> str:
+    """Makes the query of the tasks a user sees that changed after a version."""
+    return TASK_LISTING_QUERY + f"WHERE {sync_scope('task', group_count)};"
+
+
+def sync_tombstone_query(group_count: int) -> str:
+    """Makes the query of the tasks a user lost sight of after a version."""
+    return (
+        "SELECT DISTINCT task_tombstone.uuid FROM task_tombstone "
+        f"WHERE {sync_scope('task_tombstone', group_count)};"
+    )
+
+
+def sync_scope_digest(group_ids: list[str]) -> str:
+    """Fingerprints the groups a sync cursor is valid for."""
+    return sha256("\n".join(sorted(group_ids)).encode("utf-8")).hexdigest()[:16]
+
+
+def calendar_summary_query(group_count: int) -> str:
+    """Makes the query counting a user's tasks per day of a due window.
+
+    Days follow the local time of the server, like the due dates add_task
+    computes. Each branch is a range search on a (scope, due) index.
+    """
+    groups: str = ", ".join("?" * group_count)
+    return (
+        "SELECT date(task.due, 'unixepoch', 'localtime') AS day, "
+        "task.completed, task.priority, COUNT(*) FROM task "
+        f"WHERE (task.group_uuid IN ({groups}) AND task.due >= ? AND task.due < ?) "
+        "OR (task.assign_uuid = ? AND task.due >= ? AND task.due < ?) "
+        "GROUP BY day, task.completed, task.priority;"
+    )
+
+
+def make_sync_cursor(version: int, scope: str) -> str:
+    """Makes the opaque cursor handed to the client."""
+    return f"{version}.{scope}"
+
+
+def read_sync_cursor(cursor: str | None, scope: str) -> int | None:
+    """Gets the version of a cursor, None when the client must start over.
+
+    The cursor is only valid for the groups it was made for, a user who
+    joined or left a group gets a full listing again.
+    """
+    if not cursor:
+        return None
+    version, _, cursor_scope = cursor.partition(".")
+    if cursor_scope != scope or not version.isdigit():
+        return None
+    return int(version)
 
 
 class TaskController:
@@ -25,48 +342,25 @@ class TaskController:
         request_data: dict[str, Any],
     ) -> str:
         """This will add the task."""
-        if not Validator().check_user_exists(
-            user_id=request_data["assigner_id"]
-        ) or not Validator().check_user_exists(user_id=request_data["assign_id"]):
-            raise BackendError("Backend Error: User does not exist", "304")
-        if request_data["group_id"] != "0" and not Validator().check_group_exists(
-            group_id=request_data["group_id"]
+        authorization: Authorization = Validator().authorize(
+            user_id=request_data["assigner_id"],
+            password=request_data["password"],
+            group_id=request_data["group_id"],
+        )
+        if not authorization.user_exists or not Validator().check_user_exists(
+            user_id=request_data["assign_id"]
         ):
+            raise BackendError("Backend Error: User does not exist", "304")
+        if request_data["group_id"] != "0" and not authorization.group_exists:
             raise BackendError("Backend Error: Group does not exist", "306")
-        if not Validator().check_password(
-            user_id=request_data["assigner_id"], password=request_data["password"]
-        ):
+        if not authorization.password_correct:
             raise BackendError("Backend Error: Password is incorrect", "305")
-        task_id: str = str(uuid4())
-        while Validator().check_duplicate_id(data_table="task", given_id=task_id):
-            task_id = str(uuid4())
-        task_due: float = datetime(
-            int(request_data.get("task_due_year", "2000")),
-            int(request_data.get("task_due_month", "1")),
-            int(request_data.get("task_due_date", "1")),
-            int(request_data.get("task_due_hour", "0")),
-            int(request_data.get("task_due_min", "0")),
-            0,
-        ).timestamp()
+        task_params: tuple = task_insert_params("", request_data)
         with db_operation() as data_cursor:
-            data_cursor.execute(
-                "INSERT INTO task VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);",
-                (
-                    task_id,
-                    request_data["task_name"],
-                    request_data.get("task_description", ""),
-                    task_due,
-                    int(request_data.get("task_est_day", "1")),
-                    int(request_data.get("task_est_hour", "0")),
-                    int(request_data.get("task_est_min", "0")),
-                    request_data["assigner_id"],
-                    request_data["assign_id"],
-                    request_data["group_id"],
-                    0,  # completed = 0
-                    int(request_data.get("priority", "0")),
-                    int(request_data.get("recursive", "0")),
-                    "",  # image_path = ""
-                ),
+            task_id: str = insert_with_new_id(
+                data_cursor,
+                TASK_INSERT_QUERY,
+                lambda new_task_id: (new_task_id, *task_params[1:]),
             )
         return task_id
 
@@ -74,51 +368,52 @@ class TaskController:
         self,
         request_data: dict[str, Any],
     ) -> bool:
-        """This will edit the task."""
-        if not Validator().check_task_exists(task_id=request_data["task_id"]):
-            raise BackendError("Backend Error: Task does not exist", "309")
-        if not Validator().check_user_exists(
-            user_id=request_data["assigner_id"]
-        ) or not Validator().check_user_exists(user_id=request_data["assign_id"]):
+        """This will edit the fields of the task the request carries.
+
+        Only the given fields are checked and written, so ticking a task
+        done costs the authorization and one UPDATE. The UPDATE itself
+        checks that the task is in a group of the user, or assigned by or
+        to the user.
+        """
+        user_id: str = request_data["user_id"]
+        changes: dict[str, Any] = task_changes(request_data)
+        if not changes:
+            raise BackendError("Backend Error: Nothing to change", "110")
+        new_group: str | None = changes.get("group_uuid")
+        authorization: Authorization = Validator().authorize(
+            user_id=user_id,
+            password=request_data["password"],
+            group_id=new_group,
+            task_id=request_data["task_id"],
+        )
+        if not authorization.user_exists:
             raise BackendError("Backend Error: User does not exist", "304")
-        if request_data["group_id"] != "0" and not Validator().check_group_exists(
-            request_data["group_id"]
-        ):
-            raise BackendError("Backend Error: Group does not exist", "306")
-        if not Validator().check_password(
-            user_id=request_data["assigner_id"], password=request_data["password"]
-        ):
+        if not authorization.password_correct:
             raise BackendError("Backend Error: Password is incorrect", "305")
-        task_due: float = datetime(
-            int(request_data.get("task_due_year", "2000")),
-            int(request_data.get("task_due_month", "1")),
-            int(request_data.get("task_due_date", "1")),
-            int(request_data.get("task_due_hour", "0")),
-            int(request_data.get("task_due_min", "0")),
-            0,
-        ).timestamp()
+        if not authorization.task_exists:
+            raise BackendError("Backend Error: Task does not exist", "309")
+        if new_group not in (None, "0"):
+            if not authorization.group_exists:
+                raise BackendError("Backend Error: Group does not exist", "306")
+            if not authorization.in_group:
+                raise BackendError("Backend Error: User is not in the group", "310")
+        if "assign_uuid" in changes and not Validator().check_user_exists(
+            user_id=changes["assign_uuid"]
+        ):
+            raise BackendError("Backend Error: User does not exist", "304")
+        columns: tuple[str, ...] = tuple(sorted(changes))
         with db_operation() as data_cursor:
             data_cursor.execute(
-                "UPDATE task SET name = ?, description = ?, due = ?, est_day = ?, "
-                "est_hour = ?, est_min = ?, assigner_uuid = ?, assign_uuid = ?, group_uuid = ?, "
-                "recursive = ?, priority = ?, image_path = ?, completed = ? "
-                "WHERE uuid = ?;",
+                task_update_query(columns, guarded=True),
                 (
-                    request_data["task_name"],
-                    request_data.get("task_description", ""),
-                    task_due,
-                    int(request_data.get("task_est_day", "1")),
-                    int(request_data.get("task_est_hour", "0")),
-                    int(request_data.get("task_est_min", "0")),
-                    request_data["assigner_id"],
-                    request_data["assign_id"],
-                    request_data["group_id"],
-                    int(request_data.get("recursive", "0")),
-                    int(request_data.get("priority", "0")),
-                    int(request_data.get("completed", "0")),
+                    *(changes[column] for column in columns),
                     request_data["task_id"],
+                    user_id,
+                    user_id,
                 ),
             )
+            if data_cursor.rowcount == 0:
+                raise BackendError("Backend Error: User may not change the task", "317")
         return True
 
     def delete_task_control(
@@ -128,133 +423,384 @@ class TaskController:
         password: str,
     ) -> None:
         """This will delete the task."""
-        if not Validator().check_task_exists(task_id=task_id):
+        authorization: Authorization = Validator().authorize(
+            user_id=user_id, password=password, task_id=task_id
+        )
+        if not authorization.task_exists:
             raise BackendError("Backend Error: Task does not exist", "309")
-        if not Validator().check_password(user_id=user_id, password=password):
+        if not authorization.password_correct:
             raise BackendError("Backend Error: Password is incorrect", "305")
         with db_operation() as data_cursor:
+            data_cursor.execute("DELETE FROM task WHERE uuid = ?;", (task_id,))
+            self.prune_tombstones(data_cursor)
+        call_after_commit(remove_unreferenced_images)
+
+    def prune_tombstones(self, data_cursor: Cursor) -> None:
+        """Drops tombstones older than TOMBSTONE_TTL.
+
+        pruned_version remembers the newest dropped version, so a cursor
+        from before it gets a full listing instead of missing deletes.
+        """
+        expired: float = time() - TOMBSTONE_TTL
+        data_cursor.execute(
+            "UPDATE task_sync SET pruned_version = "
+            "(SELECT MAX(row_version) FROM task_tombstone WHERE deleted_at < ?) "
+            "WHERE EXISTS(SELECT 1 FROM task_tombstone WHERE deleted_at < ?);",
+            (expired, expired),
+        )
+        data_cursor.execute(
+            "DELETE FROM task_tombstone WHERE deleted_at < ?;", (expired,)
+        )
+
+    def batch_task_control(
+        self, user_id: str, password: str, operations: list[Any]
+    ) -> list[dict[str, Any]]:
+        """Applies a list of create, edit, complete and delete operations.
 
+        The users, groups and tasks the operations name are checked with one
+        query each, then every accepted operation is written in one
+        transaction: creates and deletes with executemany, edits with one
+        guarded UPDATE each so a task the user may no longer change is
+        refused. Each operation gets its own result, a refused one does not
+        stop the others.
+        """
+        authorization: Authorization = Validator().authorize(
+            user_id=user_id, password=password
+        )
+        if not authorization.user_exists:
+            raise BackendError("Backend Error: User does not exist", "304")
+        if not authorization.password_correct:
+            raise BackendError("Backend Error: Password is incorrect", "305")
+        if not isinstance(operations, list) or not all(
+            isinstance(operation, dict) for operation in operations
+        ):
+            raise BackendError("Backend Error: Operations must be a list of objects", "103")
+        if len(operations) > MAX_BATCH_SIZE:
+            raise BackendError(
+                f"Backend Error: A batch holds at most {MAX_BATCH_SIZE} operations", "104"
+            )
+        my_groups: frozenset[str] = Validator().get_user_groups(user_id)
+        results: list[dict[str, Any]] = [
+            {"error_no": "0", "message": "success"} for _ in operations
+        ]
+        task_ids: set[str] = {
+            str(operation["task_id"]) for operation in operations if operation.get("task_id")
+        }
+        user_ids: set[str] = {
+            str(operation["assign_id"]) for operation in operations if operation.get("assign_id")
+        }
+        group_ids: set[str] = {
+            str(operation["group_id"]) for operation in operations if operation.get("group_id")
+        }
+        # The parameters of every new task but its id, and the operation each
+        # came from.
+        inserts: list[tuple] = []
+        creates: list[int] = []
+        # The operation, columns and parameters of every edit.
+        updates: list[tuple[int, tuple[str, ...], tuple]] = []
+        deletes: list[tuple[str]] = []
+        with db_operation() as data_cursor:
+            known_users: set[str] = self.find_existing(data_cursor, "user", "uuid", user_ids)
+            known_groups: set[str] = self.find_existing(
+                data_cursor, "task_group", "uuid", group_ids
+            )
             data_cursor.execute(
-                "SELECT image_path FROM task WHERE uuid = ?;",
-                (task_id,),
+                "SELECT uuid, group_uuid, assigner_uuid, assign_uuid "
+                f"FROM task WHERE uuid IN ({', '.join('?' * len(task_ids))});",
+                tuple(task_ids),
             )
-            result = data_cursor.fetchone()
-            if result and result[0]:
-                image_path = result[0]
-                if exists(image_path):
-                    try:
-                        remove(image_path)
-                    except Exception as err:
+            tasks: dict[str, tuple] = {task[0]: task for task in data_cursor.fetchall()}
+
+            def check_target(fields: dict[str, Any]) -> None:
+                """Checks the assignee and group an operation sets, if any."""
+                if "assign_id" in fields and str(fields["assign_id"]) not in known_users:
+                    raise BackendError("Backend Error: User does not exist", "304")
+                group_id: str = str(fields.get("group_id", "0"))
+                if group_id != "0" and group_id not in known_groups:
+                    raise BackendError("Backend Error: Group does not exist", "306")
+                if group_id != "0" and group_id not in my_groups:
+                    raise BackendError("Backend Error: User is not in the group", "310")
+
+            seen: set[str] = set()
+            for index, operation in enumerate(operations):
+                kind: Any = operation.get("op")
+                try:
+                    if kind == "create":
+                        missing: list[str] = [
+                            field
+                            for field in ("task_name", "assign_id", "group_id")
+                            if not operation.get(field)
+                        ]
+                        if missing:
+                            raise BackendError(
+                                f"Backend Error: Missing {', '.join(missing)}", "110"
+                            )
+                        check_target(operation)
+                        inserts.append(
+                            task_insert_params(
+                                "", {**operation, "assigner_id": user_id}
+                            )[1:]
+                        )
+                        creates.append(index)
+                        continue
+                    if kind not in ("edit", "complete", "delete"):
+                        raise BackendError(f"Backend Error: Unknown operation {kind}", "103")
+                    task_id: str = str(operation.get("task_id") or "")
+                    task: tuple | None = tasks.get(task_id)
+                    if task is None:
+                        raise BackendError("Backend Error: Task does not exist", "309")
+                    if task[1] not in my_groups and user_id not in (task[2], task[3]):
                         raise BackendError(
-                            "Backend Error: Unable to delete image.", "203"
-                        ) from err
+                            "Backend Error: User may not change the task", "317"
+                        )
+                    if task_id in seen:
+                        raise BackendError(
+                            "Backend Error: Task appears more than once in the batch",
+                            "316",
+                        )
+                    if kind == "delete":
+                        deletes.append((task_id,))
+                    else:
+                        changes: dict[str, Any] = (
+                            task_changes(operation)
+                            if kind == "edit"
+                            else {"completed": completed_flag(operation.get("completed", 1))}
+                        )
+                        if not changes:
+                            raise BackendError("Backend Error: Nothing to change", "110")
+                        check_target(operation if kind == "edit" else {})
+                        columns: tuple[str, ...] = tuple(sorted(changes))
+                        updates.append(
+                            (index, columns, (*(changes[column] for column in columns), task_id))
+                        )
+                    seen.add(task_id)
+                    results[index]["task_id"] = task_id
+                except BackendError as err:
+                    results[index] = batch_error(err)
+                except (TypeError, ValueError):
+                    results[index] = batch_error(
+                        BackendError("Backend Error: A field has the wrong type", "103")
+                    )
+            for index, task_id in zip(
+                creates,
+                insert_many_with_new_ids(data_cursor, TASK_INSERT_QUERY, inserts),
+            ):
+                results[index]["task_id"] = task_id
+            for index, columns, row in updates:
+                data_cursor.execute(
+                    task_update_query(columns, guarded=True), (*row, user_id, user_id)
+                )
+                if data_cursor.rowcount == 0:
+                    results[index] = batch_error(
+                        BackendError("Backend Error: User may not change the task", "317")
+                    )
+            data_cursor.executemany("DELETE FROM task WHERE uuid = ?;", deletes)
+            if deletes:
+                self.prune_tombstones(data_cursor)
+        if deletes:
+            call_after_commit(remove_unreferenced_images)
+        return results
 
-            data_cursor.execute("DELETE FROM task WHERE uuid = ?;", (task_id,))
+    def find_existing(
+        self, data_cursor: Cursor, table: str, column: str, ids: set[str]
+    ) -> set[str]:
+        """Gets which of the ids are in a column, with one query."""
+        if not ids:
+            return set()
+        data_cursor.execute(
+            f"SELECT {column} FROM {table} "
+            f"WHERE {column} IN ({', '.join('?' * len(ids))});",
+            tuple(ids),
+        )
+        return {row[0] for row in data_cursor.fetchall()}
 
-    def get_user_task_control(self, user_id: str, password: str) -> dict[str, dict]:
-        """This will get the task from the user."""
-        if not Validator().check_user_exists(user_id=user_id):
+    def get_user_task_control(
+        self,
+        user_id: str,
+        password: str,
+        due_from: float | None = None,
+        due_to: float | None = None,
+        include_completed: bool = True,
+        sort: str = "due",
+        after: str | None = None,
+        limit: int | None = None,
+    ) -> dict[str, Any]:
+        """This will get the task from the user, optionally in a due window."""
+        authorization: Authorization = Validator().authorize(
+            user_id=user_id, password=password
+        )
+        if not authorization.user_exists:
             raise BackendError("Backend Error: User does not exist", "304")
-        if not Validator().check_password(user_id=user_id, password=password):
+        if not authorization.password_correct:
             raise BackendError("Backend Error: Password is incorrect", "305")
-        with db_operation() as data_cursor:
-            data_cursor.execute("SELECT * FROM task WHERE assign_uuid = ?;", (user_id,))
-            task_list: list[tuple] = data_cursor.fetchall()
-        new_task_list: dict[str, dict] = {}
-        for task in task_list:
-            # Get assigner username
-            assigner_username = "Unknown"
-            with db_operation() as username_cursor:
-                username_cursor.execute(
-                    "SELECT username FROM user WHERE uuid = ?;", (task[7],)
-                )
-                username_result = username_cursor.fetchone()
-                if username_result:
-                    assigner_username = username_result[0]
-
-            # Get assignee username
-            assignee_username = "Unknown"
-            with db_operation() as username_cursor:
-                username_cursor.execute("SELECT username FROM user WHERE uuid = ?;", (task[8],))
-                username_result = username_cursor.fetchone()
-                if username_result:
-                    assignee_username = username_result[0]
-
-            new_task_list[task[0]] = {
-                "name": task[1],
-                "description": task[2],
-                "due_timestamp": float(task[3]),
-                "est_day": int(task[4]),
-                "est_hour": int(task[5]),
-                "est_min": int(task[6]),
-                "assigner_id": task[7],
-                "assigner_username": assigner_username,
-                "assign_id": task[8],
-                "assignee_username": assignee_username,
-                "group_id": task[9],
-                "completed": bool(task[10]),
-                "priority": int(task[11]) if len(task) > 11 else 0,
-                "recursive": int(task[12]) if len(task) > 12 else 0,
-                "image_path": task[13] if len(task) > 13 else "",
-            }
-        return new_task_list
+        return self.list_task_page(
+            "task.assign_uuid = ?",
+            user_id,
+            task_window(due_from, due_to, include_completed),
+            sort,
+            after,
+            limit,
+        )
 
     def get_group_task_control(
         self,
         user_id: str,
         group_id: str,
         password: str,
-    ) -> dict[str, dict]:
-        """This will get the task from the user."""
-        if not Validator().check_user_exists(user_id=user_id):
+        due_from: float | None = None,
+        due_to: float | None = None,
+        include_completed: bool = True,
+        sort: str = "due",
+        after: str | None = None,
+        limit: int | None = None,
+    ) -> dict[str, Any]:
+        """This will get the task of the group, optionally in a due window."""
+        authorization: Authorization = Validator().authorize(
+            user_id=user_id, password=password, group_id=group_id
+        )
+        if not authorization.user_exists:
             raise BackendError("Backend Error: User does not exist", "304")
-        if not Validator().check_password(user_id=user_id, password=password):
+        if not authorization.password_correct:
             raise BackendError("Backend Error: Password is incorrect", "305")
-        if not Validator().check_group_exists(group_id=group_id):
+        if not authorization.group_exists:
             raise BackendError("Backend Error: Group does not exist", "306")
-        if not Validator().check_user_in_group(user_id=user_id, group_id=group_id):
+        if not authorization.in_group:
             raise BackendError("Backend Error: User is not in the group", "310")
+        return self.list_task_page(
+            "task.group_uuid = ?",
+            group_id,
+            task_window(due_from, due_to, include_completed),
+            sort,
+            after,
+            limit,
+        )
+
+    def list_task_page(
+        self,
+        scope: str,
+        scope_id: str,
+        window: tuple[str, tuple],
+        sort: str,
+        after: str | None,
+        limit: int | None,
+    ) -> dict[str, Any]:
+        """Gets one page of the tasks matching a scope and a window.
+
+        The tasks are keyed by id, so order lists the ids in sort order.
+        next_cursor is None on the last page.
+        """
+        if sort not in TASK_SORTS:
+            raise BackendError(f"Backend Error: Unknown sort {sort}", "103")
+        if limit is not None:
+            limit = max(1, min(limit, MAX_PAGE_SIZE))
+        elif after:
+            limit = DEFAULT_PAGE_SIZE
+        condition, order, page_params = task_page(sort, after, limit)
         with db_operation() as data_cursor:
-            data_cursor.execute("SELECT * FROM task WHERE group_uuid = ?;", (group_id,))
+            data_cursor.execute(
+                TASK_LISTING_QUERY + f"WHERE {scope}{window[0]}{condition}{order};",
+                (scope_id, *window[1], *page_params),
+            )
             task_list: list[tuple] = data_cursor.fetchall()
-        new_task_list: dict[str, dict] = {}
-        for task in task_list:
-            # Get assigner username
-            assigner_username = "Unknown"
-            with db_operation() as username_cursor:
-                username_cursor.execute(
-                    "SELECT username FROM user WHERE uuid = ?;", (task[7],)
-                )
-                username_result = username_cursor.fetchone()
-                if username_result:
-                    assigner_username = username_result[0]
-
-            # Get assignee username
-            assignee_username = "Unknown"
-            with db_operation() as username_cursor:
-                username_cursor.execute("SELECT username FROM user WHERE uuid = ?;", (task[8],))
-                username_result = username_cursor.fetchone()
-                if username_result:
-                    assignee_username = username_result[0]
-
-            new_task_list[task[0]] = {
-                "name": task[1],
-                "description": task[2],
-                "due_timestamp": float(task[3]),
-                "est_day": int(task[4]),
-                "est_hour": int(task[5]),
-                "est_min": int(task[6]),
-                "assigner_id": task[7],
-                "assigner_username": assigner_username,
-                "assign_id": task[8],
-                "assignee_username": assignee_username,
-                "group_id": task[9],
-                "completed": bool(task[10]),
-                "priority": int(task[11]) if len(task) > 11 else 0,
-                "recursive": int(task[12]) if len(task) > 12 else 0,
-                "image_path": task[13] if len(task) > 13 else "",
-            }
-        return new_task_list
+        next_cursor: str | None = None
+        if limit is not None and len(task_list) > limit:
+            task_list = task_list[:limit]
+            next_cursor = make_page_cursor(sort, task_list[-1])
+        return {
+            "tasks": {task[0]: task_row_to_dict(task) for task in task_list},
+            "order": [task[0] for task in task_list],
+            "next_cursor": next_cursor,
+        }
+
+    def sync_task_control(
+        self, user_id: str, password: str, cursor: str | None = None
+    ) -> dict[str, Any]:
+        """Gets the tasks of the user changed since the cursor.
+
+        The tasks are those of the groups of the user and those assigned to
+        the user. Without a valid cursor every task is sent and reset is set,
+        so the client replaces what it has instead of merging.
+        """
+        authorization: Authorization = Validator().authorize(
+            user_id=user_id, password=password
+        )
+        if not authorization.user_exists:
+            raise BackendError("Backend Error: User does not exist", "304")
+        if not authorization.password_correct:
+            raise BackendError("Backend Error: Password is incorrect", "305")
+        group_ids: list[str] = sorted(Validator().get_user_groups(user_id))
+        scope: str = sync_scope_digest(group_ids)
+        since: int | None = read_sync_cursor(cursor, scope)
+        deleted: list[str] = []
+        with db_operation() as data_cursor:
+            data_cursor.execute("SELECT version, pruned_version FROM task_sync;")
+            version, pruned_version = data_cursor.fetchone()
+            if since is not None and (since < pruned_version or since > version):
+                since = None
+            if since == version:
+                return {
+                    "tasks": {},
+                    "deleted": [],
+                    "cursor": make_sync_cursor(version, scope),
+                    "reset": False,
+                }
+            after: int = -1 if since is None else since
+            params: tuple = (*group_ids, after, user_id, after)
+            data_cursor.execute(sync_task_query(len(group_ids)), params)
+            task_list: list[tuple] = data_cursor.fetchall()
+            if since is not None:
+                data_cursor.execute(sync_tombstone_query(len(group_ids)), params)
+                deleted = [row[0] for row in data_cursor.fetchall()]
+        tasks: dict[str, dict] = {task[0]: task_row_to_dict(task) for task in task_list}
+        return {
+            "tasks": tasks,
+            "deleted": [task_id for task_id in deleted if task_id not in tasks],
+            "cursor": make_sync_cursor(version, scope),
+            "reset": since is None,
+        }
+
+    def get_calendar_summary_control(
+        self, user_id: str, password: str, year: int, month: int
+    ) -> dict[str, dict]:
+        """Counts the tasks of the user on each day of a month.
+
+        The tasks are those of the groups of the user and those assigned to
+        the user. Days without tasks are left out.
+        """
+        authorization: Authorization = Validator().authorize(
+            user_id=user_id, password=password
+        )
+        if not authorization.user_exists:
+            raise BackendError("Backend Error: User does not exist", "304")
+        if not authorization.password_correct:
+            raise BackendError("Backend Error: Password is incorrect", "305")
+        if not 1 <= month <= 12:
+            raise BackendError("Backend Error: Month must be from 1 to 12", "103")
+        if not 1 <= year <= 9998:
+            raise BackendError("Backend Error: Year must be from 1 to 9998", "103")
+        month_start: float = datetime(year, month, 1).timestamp()
+        month_end: float = datetime(
+            year + month // 12, month % 12 + 1, 1
+        ).timestamp()
+        group_ids: list[str] = sorted(Validator().get_user_groups(user_id))
+        with db_operation() as data_cursor:
+            data_cursor.execute(
+                calendar_summary_query(len(group_ids)),
+                (*group_ids, month_start, month_end, user_id, month_start, month_end),
+            )
+            counts: list[tuple] = data_cursor.fetchall()
+        days: dict[str, dict] = {}
+        for day, completed, priority, count in counts:
+            summary: dict = days.setdefault(
+                day, {"total": 0, "completed": 0, "pending": 0, "priority": {}}
+            )
+            summary["total"] += count
+            summary["completed" if completed else "pending"] += count
+            priority_key: str = str(priority or 0)
+            summary["priority"][priority_key] = (
+                summary["priority"].get(priority_key, 0) + count
+            )
+        return days
 
     def get_completed_task_control(
         self,
@@ -263,77 +809,67 @@ class TaskController:
         password: str,
     ) -> dict[str, dict]:
         """This will get the completed task from the user."""
-        if not Validator().check_user_exists(user_id=user_id):
+        authorization: Authorization = Validator().authorize(
+            user_id=user_id, password=password, group_id=group_id
+        )
+        if not authorization.user_exists:
             raise BackendError("Backend Error: User does not exist", "304")
-        if not Validator().check_group_exists(group_id=group_id):
+        if not authorization.group_exists:
             raise BackendError("Backend Error: Group does not exist", "306")
-        if not Validator().check_user_in_group(user_id=user_id, group_id=group_id):
+        if not authorization.in_group:
             raise BackendError("Backend Error: User is not in the group", "310")
-        if not Validator().check_password(user_id=user_id, password=password):
+        if not authorization.password_correct:
             raise BackendError("Backend Error: Password is incorrect", "305")
         with db_operation() as data_cursor:
             data_cursor.execute(
-                "SELECT * FROM task WHERE assign_id = ? "
-                "OR group_uuid IN (SELECT group_uuid FROM group_user WHERE user_id = ?) "
-                "AND completed = 1;",
-                (
-                    group_id,
-                    user_id,
-                ),
+                TASK_LISTING_QUERY
+                + "WHERE task.group_uuid = ? AND task.completed = 1;",
+                (group_id,),
             )
             task_list: list[tuple] = data_cursor.fetchall()
-        new_task_list: dict[str, dict] = {}
-        for task in task_list:
-            # Get assigner username
-            assigner_username = "Unknown"
-            with db_operation() as username_cursor:
-                username_cursor.execute(
-                    "SELECT username FROM user WHERE uuid = ?;", (task[7],)
-                )
-                username_result = username_cursor.fetchone()
-                if username_result:
-                    assigner_username = username_result[0]
-
-            new_task_list[task[0]] = {
-                "name": task[1],
-                "description": task[2],
-                "due_timestamp": float(task[3]),
-                "est_day": int(task[4]),
-                "est_hour": int(task[5]),
-                "est_min": int(task[6]),
-                "assigner_id": task[7],
-                "assigner_username": assigner_username,
-                "assign_id": task[8],
-                "group_id": task[9],
-                "completed": bool(task[10]),
-                "priority": int(task[11]) if len(task) > 11 else 0,
-                "recursive": int(task[12]) if len(task) > 12 else 0,
-                "image_path": task[13] if len(task) > 13 else "",
-            }
-        return new_task_list
+        return {task[0]: task_row_to_dict(task) for task in task_list}
 
     def toggle_complete_task_control(
         self,
-        task_id: str,
+        task_ids: list[str],
         user_id: str,
         password: str,
-        completed: int,
-    ) -> None:
-        """This will complete the task."""
-        if not Validator().check_user_exists(user_id=user_id):
+        completed: Any,
+    ) -> int:
+        """This will complete the tasks, or reopen them.
+
+        The tasks are checked and changed by one UPDATE, ids of tasks that
+        are missing or that the user may not change are skipped. Returns how
+        many tasks were changed.
+        """
+        authorization: Authorization = Validator().authorize(
+            user_id=user_id, password=password
+        )
+        if not authorization.user_exists:
             raise BackendError("Backend Error: User does not exist", "304")
-        if not Validator().check_password(user_id=user_id, password=password):
+        if not authorization.password_correct:
             raise BackendError("Backend Error: Password is incorrect", "305")
-        if not Validator().check_task_exists(task_id=task_id):
-            raise BackendError("Backend Error: Task does not exist", "309")
+        if not isinstance(task_ids, list) or not all(
+            isinstance(task_id, str) for task_id in task_ids
+        ):
+            raise BackendError("Backend Error: Task ids must be a list of strings", "103")
+        try:
+            completed_value: int = completed_flag(completed)
+        except ValueError as err:
+            raise BackendError("Backend Error: Completed must be 0 or 1", "103") from err
+        unique_ids: list[str] = list(dict.fromkeys(task_ids))
+        if len(unique_ids) > MAX_BATCH_SIZE:
+            raise BackendError(
+                f"Backend Error: At most {MAX_BATCH_SIZE} tasks at once", "104"
+            )
+        if not unique_ids:
+            return 0
         with db_operation() as data_cursor:
             data_cursor.execute(
-                "UPDATE task SET completed = ? WHERE uuid = ?;",
-                (
-                    completed,
-                    task_id,
-                ),
+                complete_task_query(len(unique_ids)),
+                (completed_value, *unique_ids, user_id, user_id),
             )
+            return data_cursor.rowcount
 
 
 if __name__ == "__main__":
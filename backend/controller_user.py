@@ -1,15 +1,19 @@
 # coding: utf-8
 """This module handles the functions related to user for database."""
 
-from os import remove
-from os.path import exists
-
 from typing import Any
-from uuid import uuid4
 
+from controller_session import SessionController
 from error import BackendError
-from utils import db_operation
-from validator import Validator
+from image_store import remove_unreferenced_images
+from utils import call_after_commit, db_operation, insert_with_new_id
+from validator import Authorization, Validator
+
+# The tasks a user assigned or was assigned, served by the assigner and
+# assignee indexes.
+DELETE_USER_TASKS_QUERY: str = (
+    "DELETE FROM task WHERE assigner_uuid = ? OR assign_uuid = ?;"
+)
 
 
 class UserController:
@@ -21,17 +25,16 @@ class UserController:
 
     def add_user_control(self, username: str, email: str, password: str) -> str:
         """This function creates a new user."""
-        user_id: str = str(uuid4())
-        while Validator().check_duplicate_id(data_table="user", given_id=user_id):
-            user_id = str(uuid4())
         if Validator().check_username(username=username):
             raise BackendError("Backend Error: Username already exists", "301")
         if Validator().check_email(email=email):
             raise BackendError("Backend Error: Email already exists", "302")
         with db_operation() as data_cursor:
-            data_cursor.execute(
-                "INSERT INTO user VALUES (?, ?, ?, ?, ?);",
-                (user_id, username, email, password, ""),
+            user_id: str = insert_with_new_id(
+                data_cursor,
+                "INSERT INTO user (uuid, username, email, password, image_path) "
+                "VALUES (?, ?, ?, ?, ?);",
+                lambda new_user_id: (new_user_id, username, email, password, ""),
             )
         return user_id
 
@@ -39,8 +42,8 @@ class UserController:
         self,
         email: str,
         password: str,
-    ) -> dict[str, str]:
-        """This will login a user."""
+    ) -> dict[str, Any]:
+        """This will login a user and start a session."""
         if not Validator().check_login(email=email, password=password):
             raise BackendError("Backend Error: Email or Password is incorrect", "303")
         with db_operation() as data_cursor:
@@ -49,22 +52,31 @@ class UserController:
                 (email,),
             )
             user_data = data_cursor.fetchone()
-        return {"user_id": user_data[0], "username": user_data[1]}
+        session: dict[str, Any] = SessionController().create_session_control(
+            user_id=user_data[0]
+        )
+        return {
+            "user_id": user_data[0],
+            "username": user_data[1],
+            "token": session["token"],
+            "expires_at": session["expires_at"],
+        }
 
     def edit_user_control(
         self,
         request_data: dict[str, Any],
     ) -> None:
         """Edits a user information."""
-        if not Validator().check_user_exists(user_id=request_data["user_id"]):
+        authorization: Authorization = Validator().authorize(
+            user_id=request_data["user_id"], password=request_data["password"]
+        )
+        if not authorization.user_exists:
             raise BackendError("Backend Error: User does not exist", "304")
         if Validator().check_username(username=request_data["username"]):
             raise BackendError("Backend Error: Username already exists", "301")
         if Validator().check_email(email=request_data["email"]):
             raise BackendError("Backend Error: Email already exists", "302")
-        if not Validator().check_password(
-            user_id=request_data["user_id"], password=request_data["password"]
-        ):
+        if not authorization.password_correct:
             raise BackendError("Backend Error: Password is incorrect", "305")
         with db_operation() as data_cursor:
             data_cursor.execute(
@@ -79,6 +91,9 @@ class UserController:
                     request_data["user_id"],
                 ),
             )
+        SessionController().revoke_user_sessions_control(
+            user_id=request_data["user_id"]
+        )
 
     def delete_user_control(
         self,
@@ -86,26 +101,16 @@ class UserController:
         password: str,
     ) -> None:
         """Deletes a user from the database."""
-        if not Validator().check_user_exists(user_id=user_id):
+        authorization: Authorization = Validator().authorize(
+            user_id=user_id, password=password
+        )
+        if not authorization.user_exists:
             raise BackendError("Backend Error: User does not exist", "304")
-        if not Validator().check_password(user_id=user_id, password=password):
+        if not authorization.password_correct:
             raise BackendError("Backend Error: Password is incorrect", "305")
+        SessionController().revoke_user_sessions_control(user_id=user_id)
+        Validator().invalidate_membership(user_id)
         with db_operation() as data_cursor:
-            data_cursor.execute(
-                "SELECT image_path FROM user WHERE uuid = ?;",
-                (user_id,),
-            )
-            result = data_cursor.fetchone()
-            if result and result[0]:
-                image_path = result[0]
-                if exists(image_path):
-                    try:
-                        remove(image_path)
-                    except Exception as err:
-                        raise BackendError(
-                            "Backend Error: Unable to delete image.", "203"
-                        ) from err
-
             data_cursor.execute(
                 "DELETE FROM user WHERE uuid = ?;",
                 (user_id,),
@@ -114,10 +119,7 @@ class UserController:
                 "DELETE FROM group_user WHERE user_id = ?;",
                 (user_id,),
             )
-            data_cursor.execute(
-                "DELETE FROM task WHERE assigner_uuid = ? OR assign_uuid = ?;",
-                (user_id, user_id),
-            )
+            data_cursor.execute(DELETE_USER_TASKS_QUERY, (user_id, user_id))
             data_cursor.execute(
                 "DELETE FROM group_invites WHERE inviter_id = ? OR invitee_id = ?;",
                 (user_id, user_id),
@@ -139,6 +141,7 @@ class UserController:
             #     "SELECT FROM group_user WHERE group_id = ? AND user_id = ?;",
             #     (user_id,),
             # )
+        call_after_commit(remove_unreferenced_images)
 
 
 if __name__ == "__main__":
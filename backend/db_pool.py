@@ -0,0 +1,186 @@
+# coding: utf-8
+"""This module keeps a pool of reusable sqlite connections."""
+
+from atexit import register
+from os import environ
+from queue import Empty, Full, LifoQueue
+from sqlite3 import connect, Connection, Error
+from threading import Lock
+
+from error import BackendError
+
+DEFAULT_POOL_SIZE: int = 8
+DEFAULT_POOL_TIMEOUT: float = 5.0
+
+# Pragmas applied to every connection, in order, before it is handed out.
+# "durable" fsyncs on every commit, "throughput" only at WAL checkpoints,
+# which can lose the last commits on power loss but never corrupts the file.
+PRAGMA_PROFILES: dict[str, dict[str, str | int]] = {
+    "durable": {
+        "busy_timeout": 5000,
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "cache_size": -8000,
+        "mmap_size": 0,
+        "temp_store": "DEFAULT",
+    },
+    "throughput": {
+        "busy_timeout": 5000,
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -64000,
+        "mmap_size": 268435456,
+        "temp_store": "MEMORY",
+    },
+}
+DEFAULT_PRAGMA_PROFILE: str = environ.get("ROOMIEBUDDY_DB_PROFILE", "throughput")
+
+
+class ConnectionPool:
+    """This class hands out reusable connections to one database file."""
+
+    def __init__(
+        self,
+        db_name: str,
+        max_size: int = DEFAULT_POOL_SIZE,
+        timeout: float = DEFAULT_POOL_TIMEOUT,
+        profile: str = DEFAULT_PRAGMA_PROFILE,
+    ) -> None:
+        """Initialize the pool, connections are opened lazily."""
+        if profile not in PRAGMA_PROFILES:
+            raise BackendError(
+                f"Backend Error: Unknown database profile {profile}", "201"
+            )
+        self.db_name: str = db_name
+        self.pragmas: dict[str, str | int] = PRAGMA_PROFILES[profile]
+        self.max_size: int = max_size
+        self.timeout: float = timeout
+        self._idle: LifoQueue[Connection] = LifoQueue(maxsize=max_size)
+        self._lock: Lock = Lock()
+        self._opened: int = 0
+        self._closed: bool = False
+
+    def _open(self) -> Connection:
+        """Opens a new connection that may move between threads.
+
+        Transactions are begun and ended explicitly by the caller.
+        """
+        data_con: Connection = connect(
+            self.db_name, check_same_thread=False, isolation_level=None
+        )
+        try:
+            for pragma, value in self.pragmas.items():
+                data_con.execute(f"PRAGMA {pragma} = {value};").fetchall()
+        except Error:
+            data_con.close()
+            raise
+        return data_con
+
+    def _is_healthy(self, data_con: Connection) -> bool:
+        """Checks if an idle connection can still be used."""
+        try:
+            data_con.execute("SELECT 1;").fetchone()
+        except Error:
+            return False
+        return not data_con.in_transaction
+
+    def _discard(self, data_con: Connection) -> None:
+        """Closes a connection and frees its slot in the pool."""
+        try:
+            data_con.close()
+        except Error:
+            pass
+        with self._lock:
+            self._opened -= 1
+
+    def _reserve_slot(self) -> bool:
+        """Reserves room for a new connection if the pool is not full."""
+        with self._lock:
+            if self._opened >= self.max_size:
+                return False
+            self._opened += 1
+            return True
+
+    def acquire(self) -> Connection:
+        """Gets a healthy connection, waiting if every connection is in use."""
+        while True:
+            if self._closed:
+                raise BackendError(
+                    "Backend Error: Database connection is not established", "202"
+                )
+            try:
+                data_con: Connection = self._idle.get_nowait()
+            except Empty:
+                if self._reserve_slot():
+                    try:
+                        return self._open()
+                    except Error as err:
+                        with self._lock:
+                            self._opened -= 1
+                        raise BackendError(
+                            "Backend Error: Database connection is not established",
+                            "202",
+                        ) from err
+                try:
+                    data_con = self._idle.get(timeout=self.timeout)
+                except Empty as err:
+                    raise BackendError(
+                        "Backend Error: Database connection is not established", "202"
+                    ) from err
+            if self._is_healthy(data_con):
+                return data_con
+            self._discard(data_con)
+
+    def release(self, data_con: Connection) -> None:
+        """Gives a connection back to the pool."""
+        if self._closed:
+            self._discard(data_con)
+            return
+        try:
+            if data_con.in_transaction:
+                data_con.rollback()
+        except Error:
+            self._discard(data_con)
+            return
+        try:
+            self._idle.put_nowait(data_con)
+        except Full:
+            self._discard(data_con)
+
+    def close(self) -> None:
+        """Closes every idle connection and refuses new ones."""
+        self._closed = True
+        while True:
+            try:
+                data_con: Connection = self._idle.get_nowait()
+            except Empty:
+                break
+            self._discard(data_con)
+
+
+_POOLS: dict[str, ConnectionPool] = {}
+_POOLS_LOCK: Lock = Lock()
+
+
+def get_pool(db_name: str) -> ConnectionPool:
+    """Gets the shared pool for a database file, creating it if needed."""
+    with _POOLS_LOCK:
+        pool: ConnectionPool | None = _POOLS.get(db_name)
+        if pool is None:
+            pool = ConnectionPool(db_name)
+            _POOLS[db_name] = pool
+        return pool
+
+
+@register
+def close_all_pools() -> None:
+    """Closes every pool, this also runs when the interpreter exits."""
+    with _POOLS_LOCK:
+        pools: list[ConnectionPool] = list(_POOLS.values())
+        _POOLS.clear()
+    for pool in pools:
+        pool.close()
+
+
+if __name__ == "__main__":
+    print("This is a module and should not be run directly.")
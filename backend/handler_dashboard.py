@@ -0,0 +1,38 @@
+# coding: utf-8
+"""This will hold the dashboard handle class."""
+
+from typing import Any
+
+from flask import Request
+from error import BackendError, handle_backend_exceptions
+from controller_dashboard import DashboardController
+from utils import extract_request_data
+
+
+class DashboardHandle:
+    """This class handles the dashboard of a user."""
+
+    def __init__(self, input_request: Request) -> None:
+        """Initialize the dashboard handle with the request."""
+        self.user_request: Request = input_request
+        if self.user_request.method != "POST":
+            raise BackendError(
+                message="Wrong request type!",
+                error_code="100",
+            )
+
+    @handle_backend_exceptions
+    def get_dashboard_request(self) -> dict[str, Any]:
+        """Gets the groups, pending invites and tasks of the user."""
+        request_data: dict[str, Any] = extract_request_data(
+            request=self.user_request,
+            required_fields=["user_id", "password"],
+        )
+        return DashboardController().get_dashboard_control(
+            user_id=request_data["user_id"],
+            password=request_data["password"],
+        )
+
+
+if __name__ == "__main__":
+    print("This is a module and should not be run directly.")
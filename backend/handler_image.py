@@ -6,7 +6,7 @@ from typing import Any
 from flask import Request
 from error import BackendError, handle_backend_exceptions
 from controller_image import ImageController
-from utils import extract_request_data
+from utils import extract_request_data, get_session_user
 from log import make_new_log
 
 
@@ -75,14 +75,14 @@ class ImageHandle:
                 error_code="110",
             )
         
-        if not self.user_request.form.get("password"):
+        if not self.user_request.form.get("password") and get_session_user() is None:
             raise BackendError(
                 message="Missing password field",
                 error_code="110",
             )
         
         user_id = self.user_request.form.get("user_id")
-        password = self.user_request.form.get("password")
+        password = self.user_request.form.get("password", "")
         
         # Process the image
         return ImageController().upload_user_image_control(
@@ -111,7 +111,7 @@ class ImageHandle:
                 error_code="110",
             )
         
-        if not self.user_request.form.get("password"):
+        if not self.user_request.form.get("password") and get_session_user() is None:
             raise BackendError(
                 message="Missing password field",
                 error_code="110",
@@ -132,7 +132,7 @@ class ImageHandle:
         # Create request data dictionary
         request_data = {
             "user_id": self.user_request.form.get("user_id"),
-            "password": self.user_request.form.get("password"),
+            "password": self.user_request.form.get("password", ""),
             "task_id": self.user_request.form.get("task_id"),
             "group_id": self.user_request.form.get("group_id"),
         }
@@ -6,7 +6,7 @@ from typing import Any
 from flask import Request
 from error import BackendError, handle_backend_exceptions
 from controller_invite import InviteController
-from utils import extract_request_data, db_operation
+from utils import extract_request_data, optional_int
 
 
 class InviteHandle:
@@ -44,6 +44,25 @@ class InviteHandle:
             password=password,
         )
 
+    @handle_backend_exceptions
+    def create_invites_request(self) -> list[dict[str, Any]]:
+        """Handle the invites of many users to a group."""
+        request_data: dict[str, Any] = extract_request_data(
+            request=self.user_request,
+            required_fields=[
+                "inviter_id",
+                "group_id",
+                "password",
+                "invitees",
+            ],
+        )
+        return InviteController().create_invites_control(
+            inviter_id=request_data["inviter_id"],
+            group_id=request_data["group_id"],
+            password=request_data["password"],
+            invitees=request_data["invitees"],
+        )
+
     @handle_backend_exceptions
     def respond_invite_request(self) -> None:
         """Handle the invite."""
@@ -61,30 +80,15 @@ class InviteHandle:
         password: str = request_data["password"]
         status: str = request_data["status"]
 
-        # Get group_id from invite_id
-        group_id = self._get_group_id_from_invite(invite_id, user_id)
-
         # Convert status to boolean accept
         accept = status.lower() == "accepted"
         return InviteController().respond_invite_control(
             user_id=user_id,
-            group_id=group_id,
+            invite_id=invite_id,
             password=password,
             accept=accept,
         )
 
-    def _get_group_id_from_invite(self, invite_id: str, user_id: str) -> str:
-        """Get group_id from invite_id."""
-        with db_operation() as data_cursor:
-            data_cursor.execute(
-                "SELECT group_id FROM group_invites WHERE invite_id = ? AND invitee_id = ?;",
-                (invite_id, user_id),
-            )
-            result = data_cursor.fetchone()
-            if not result:
-                raise BackendError("Backend Error: Invite does not exist", "308")
-            return result[0]
-
     @handle_backend_exceptions
     def get_pending_request(self) -> dict[str, dict[str, Any]]:
         """Get the pending invites."""
@@ -126,8 +130,8 @@ class InviteHandle:
         )
 
     @handle_backend_exceptions
-    def sent_invite_request(self) -> dict[str, dict[str, Any]]:
-        """Get the sent invites."""
+    def sent_invite_request(self) -> dict[str, Any]:
+        """Get a page of the sent invites."""
         request_data: dict[str, Any] = extract_request_data(
             request=self.user_request,
             required_fields=[
@@ -143,6 +147,8 @@ class InviteHandle:
             user_id=user_id,
             group_id=group_id,
             password=password,
+            after=request_data.get("after"),
+            limit=optional_int(request_data, "limit"),
         )
 
 
@@ -0,0 +1,55 @@
+# coding: utf-8
+"""This will hold the session handle class."""
+
+from typing import Any
+
+from flask import Request, g
+from error import BackendError, handle_backend_exceptions
+from controller_session import SessionController
+
+
+class SessionHandle:
+    """This class handles the session tokens of a request."""
+
+    def __init__(self, input_request: Request) -> None:
+        """Initialize the session handle with the request."""
+        self.user_request: Request = input_request
+
+    def _get_token(self) -> str | None:
+        """Gets the token from the Authorization header or the request data."""
+        header: str = self.user_request.headers.get("Authorization", "")
+        if header.startswith("Bearer "):
+            return header[len("Bearer "):].strip() or None
+        if self.user_request.is_json:
+            request_data: Any = self.user_request.get_json(silent=True)
+            if isinstance(request_data, dict) and request_data.get("token"):
+                return str(request_data["token"])
+        return self.user_request.form.get("token") or None
+
+    @handle_backend_exceptions
+    def load_session_request(self) -> None:
+        """Authenticates the token of the request, if it has one."""
+        token: str | None = self._get_token()
+        if token is None:
+            return
+        user_id: str | None = SessionController().authenticate_session_control(token)
+        if user_id is None:
+            raise BackendError("Backend Error: Session is invalid or expired", "315")
+        g.session_user_id = user_id
+        g.session_token = token
+
+    @handle_backend_exceptions
+    def logout_request(self) -> None:
+        """Ends the session of the request."""
+        if self.user_request.method != "POST":
+            raise BackendError(
+                message="Wrong request type!",
+                error_code="100",
+            )
+        if g.get("session_token") is None:
+            raise BackendError("Backend Error: Session is invalid or expired", "315")
+        SessionController().revoke_session_control(g.session_token)
+
+
+if __name__ == "__main__":
+    print("This is a module and should not be run directly.")
@@ -6,7 +6,12 @@ from typing import Any
 from flask import Request
 from error import BackendError, handle_backend_exceptions
 from controller_task import TaskController
-from utils import extract_request_data
+from utils import (
+    extract_request_data,
+    optional_float,
+    optional_int,
+    request_flag,
+)
 
 
 class TaskHandle:
@@ -41,18 +46,20 @@ class TaskHandle:
 
     @handle_backend_exceptions
     def edit_task_request(self) -> None:
-        """Edits a task."""
+        """Edits the given fields of a task.
+
+        The editing user is user_id, or assigner_id as older clients send it.
+        """
         request_data: dict[str, Any] = extract_request_data(
             request=self.user_request,
-            required_fields=[
-                "task_id",
-                "task_name",
-                "assigner_id",
-                "assign_id",
-                "group_id",
-                "password",
-            ],
+            required_fields=["task_id", "password"],
         )
+        request_data.setdefault("user_id", request_data.get("assigner_id"))
+        if not request_data["user_id"]:
+            raise BackendError(
+                message="These fields are empty! \n- user_id",
+                error_code="110",
+            )
         TaskController().edit_task_control(
             request_data=request_data,
         )
@@ -74,7 +81,7 @@ class TaskHandle:
         )
 
     @handle_backend_exceptions
-    def get_user_task_request(self) -> dict[str, dict[str, Any]]:
+    def get_user_task_request(self) -> dict[str, Any]:
         """Gets the user task."""
         request_data: dict[str, Any] = extract_request_data(
             request=self.user_request,
@@ -83,11 +90,18 @@ class TaskHandle:
         user_id: str = request_data["user_id"]
         password: str = request_data["password"]
         return TaskController().get_user_task_control(
-            user_id=user_id, password=password
+            user_id=user_id,
+            password=password,
+            due_from=optional_float(request_data, "due_from"),
+            due_to=optional_float(request_data, "due_to"),
+            include_completed=request_flag(request_data, "include_completed", True),
+            sort=str(request_data.get("sort") or "due"),
+            after=str(request_data.get("after") or "") or None,
+            limit=optional_int(request_data, "limit"),
         )
 
     @handle_backend_exceptions
-    def get_group_task_request(self) -> dict[str, dict[str, Any]]:
+    def get_group_task_request(self) -> dict[str, Any]:
         """Gets tasks for a specific group."""
         request_data: dict[str, Any] = extract_request_data(
             request=self.user_request,
@@ -99,7 +113,75 @@ class TaskHandle:
         return TaskController().get_group_task_control(
             user_id=user_id,
             group_id=group_id,
-            password=password
+            password=password,
+            due_from=optional_float(request_data, "due_from"),
+            due_to=optional_float(request_data, "due_to"),
+            include_completed=request_flag(request_data, "include_completed", True),
+            sort=str(request_data.get("sort") or "due"),
+            after=str(request_data.get("after") or "") or None,
+            limit=optional_int(request_data, "limit"),
+        )
+
+    @handle_backend_exceptions
+    def sync_tasks_request(self) -> dict[str, Any]:
+        """Gets the tasks changed since the cursor of the client."""
+        request_data: dict[str, Any] = extract_request_data(
+            request=self.user_request,
+            required_fields=["user_id", "password"],
+        )
+        return TaskController().sync_task_control(
+            user_id=request_data["user_id"],
+            password=request_data["password"],
+            cursor=str(request_data.get("cursor") or ""),
+        )
+
+    @handle_backend_exceptions
+    def get_calendar_summary_request(self) -> dict[str, dict]:
+        """Gets the number of tasks on each day of a month."""
+        request_data: dict[str, Any] = extract_request_data(
+            request=self.user_request,
+            required_fields=["user_id", "password", "year", "month"],
+        )
+        return TaskController().get_calendar_summary_control(
+            user_id=request_data["user_id"],
+            password=request_data["password"],
+            year=optional_int(request_data, "year") or 0,
+            month=optional_int(request_data, "month") or 0,
+        )
+
+    @handle_backend_exceptions
+    def complete_task_request(self) -> int:
+        """Completes or reopens a task, or every task of task_ids."""
+        request_data: dict[str, Any] = extract_request_data(
+            request=self.user_request,
+            required_fields=["user_id", "password"],
+        )
+        task_ids: Any = request_data.get("task_ids")
+        if task_ids is None and request_data.get("task_id"):
+            task_ids = [request_data["task_id"]]
+        if not task_ids:
+            raise BackendError(
+                message="These fields are empty! \n- task_id",
+                error_code="110",
+            )
+        return TaskController().toggle_complete_task_control(
+            task_ids=task_ids,
+            user_id=request_data["user_id"],
+            password=request_data["password"],
+            completed=request_data.get("completed", 1),
+        )
+
+    @handle_backend_exceptions
+    def batch_tasks_request(self) -> list[dict[str, Any]]:
+        """Applies a list of task operations at once."""
+        request_data: dict[str, Any] = extract_request_data(
+            request=self.user_request,
+            required_fields=["user_id", "password", "operations"],
+        )
+        return TaskController().batch_task_control(
+            user_id=request_data["user_id"],
+            password=request_data["password"],
+            operations=request_data["operations"],
         )
 
 
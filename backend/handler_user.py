@@ -41,7 +41,7 @@ class UserHandle:
         return user_id
 
     @handle_backend_exceptions
-    def login_user_request(self) -> dict[str, str]:
+    def login_user_request(self) -> dict[str, Any]:
         """ "Logs in a user."""
         request_data: dict[str, Any] = extract_request_data(
             request=self.user_request,
@@ -52,7 +52,7 @@ class UserHandle:
         )
         email: str = request_data["email"]
         password: str = request_data["password"]
-        user_info: dict[str, str] = UserController().login_user_control(
+        user_info: dict[str, Any] = UserController().login_user_control(
             email=email, password=password
         )
         return user_info
@@ -70,6 +70,7 @@ class UserHandle:
                 "password",
                 "new_password",
             ],
+            session_auth=False,
         )
         UserController().edit_user_control(request_data=request_data)
 
@@ -83,6 +84,7 @@ class UserHandle:
                 "user_id",
                 "password",
             ],
+            session_auth=False,
         )
         user_id: str = request_data["user_id"]
         password: str = request_data["password"]
@@ -0,0 +1,216 @@
+# coding: utf-8
+"""This module stores uuids as 16 byte blobs while the code keeps using text."""
+
+from functools import lru_cache
+from re import compile as compile_pattern, Pattern
+from sqlite3 import Connection, Cursor
+from typing import Any, Iterable
+
+# Only the canonical lowercase form of an id is encoded, any other text,
+# such as the "0" group of personal tasks, is stored and read back unchanged.
+UUID_PATTERN: Pattern[str] = compile_pattern(
+    r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"
+)
+
+# Listings repeat the same user and group ids on many rows.
+DECODED_ID_CACHE_SIZE: int = 65536
+
+# The columns holding uuids, converted by the migration to blob ids.
+ID_COLUMNS: dict[str, list[str]] = {
+    "task": ["uuid", "assigner_uuid", "assign_uuid", "group_uuid"],
+    "user": ["uuid"],
+    "task_group": ["uuid", "owner_id"],
+    "group_user": ["group_id", "user_id"],
+    "group_invites": ["invite_id", "group_id", "inviter_id", "invitee_id"],
+    "session": ["user_id"],
+}
+
+ID_COLUMN_NAMES: frozenset[str] = frozenset(
+    column for columns in ID_COLUMNS.values() for column in columns
+)
+
+# Splits a statement into strings, names, parameters, operators and symbols.
+SQL_TOKEN_PATTERN: Pattern[str] = compile_pattern(
+    r"'(?:[^']|'')*'|[A-Za-z_][\w.]*|[:@$]\w+|\?|[<>!=]=|<>|\S"
+)
+SQL_COMPARISONS: frozenset[str] = frozenset({"=", "==", "!=", "<>", "<", ">", "<=", ">="})
+STATEMENT_CACHE_SIZE: int = 1024
+
+
+def encode_id(value: Any) -> Any:
+    """Turns a canonical uuid into its 16 bytes, anything else is kept."""
+    if type(value) is str and len(value) == 36 and UUID_PATTERN.fullmatch(value):
+        return bytes.fromhex(value.replace("-", ""))
+    return value
+
+
+def format_hex_id(hex_id: str) -> str:
+    """Turns 32 hex digits into the canonical uuid text."""
+    return (
+        f"{hex_id[:8]}-{hex_id[8:12]}-{hex_id[12:16]}-{hex_id[16:20]}-{hex_id[20:]}"
+    )
+
+
+@lru_cache(maxsize=DECODED_ID_CACHE_SIZE)
+def format_blob_id(value: bytes) -> str:
+    """Turns 16 bytes into the canonical uuid text, remembering recent ids."""
+    return format_hex_id(value.hex())
+
+
+def decode_id(value: Any) -> Any:
+    """Turns a 16 byte blob back into the canonical uuid text."""
+    if type(value) is bytes and len(value) == 16:
+        return format_blob_id(value)
+    return value
+
+
+def decode_hex_id(hex_value: str) -> str:
+    """Decodes an id the database returned through hex()."""
+    if len(hex_value) == 32:
+        return format_hex_id(hex_value.lower())
+    return bytes.fromhex(hex_value).decode("utf-8")
+
+
+def is_parameter(token: str) -> bool:
+    """Tells if a token of a statement is a ? or a named parameter."""
+    return token[:1] in ("?", ":", "@", "$")
+
+
+def column_name(token: str) -> str:
+    """Drops the table or alias from a column name."""
+    return token.rsplit(".", 1)[-1]
+
+
+def list_columns(tokens: list[str], close: int) -> list[str]:
+    """Gets the columns of the parenthesized list ending at close."""
+    columns: list[str] = []
+    depth: int = 0
+    for index in range(close - 1, -1, -1):
+        if tokens[index] == ")":
+            depth += 1
+        elif tokens[index] == "(" and depth:
+            depth -= 1
+        elif tokens[index] == "(":
+            break
+        elif depth == 0 and tokens[index - 1] in ("(", ","):
+            columns.append(column_name(tokens[index]))
+    return columns[::-1]
+
+
+def bound_column(tokens: list[str], index: int) -> str | None:
+    """Gets the column the parameter at index is compared with or stored in.
+
+    It covers column = ?, ? IN (column, ...), column IN (?, ...), row values
+    (a, b) > (?, ?), INSERT column lists with VALUES or SELECT, and SET, so
+    an INSERT has to name its columns.
+    """
+    if tokens[index - 1] in SQL_COMPARISONS:
+        return column_name(tokens[index - 2])
+    if [token.upper() for token in tokens[index + 1:index + 3]] == ["IN", "("]:
+        columns: list[str] = list_columns(tokens, tokens.index(")", index))
+        return next((column for column in columns if column in ID_COLUMN_NAMES), None)
+    # Walk back over the list the parameter is in to what opens the list.
+    position: int = 0
+    start: int = index - 1
+    while tokens[start] == "," or tokens[start][:1] in ("?", ":", "@", "$", "'") or tokens[start].isdigit():
+        position += tokens[start] == ","
+        start -= 1
+    opener: str = tokens[start].upper()
+    before: str = tokens[start - 1].upper()
+    if opener == "(" and before == "IN":
+        return column_name(tokens[start - 2])
+    if (opener == "(" and before in ("VALUES", *SQL_COMPARISONS)) or opener == "SELECT":
+        close: int = start - 2 if opener == "(" else start - 1
+        if tokens[close] == ")":
+            columns = list_columns(tokens, close)
+            return columns[position] if position < len(columns) else None
+    return None
+
+
+@lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def id_parameters(sql: str) -> frozenset[int | str]:
+    """Finds the parameters of a statement bound to an id column.
+
+    Positional parameters are given by their index, named ones by name.
+    """
+    tokens: list[str] = ["", "", *SQL_TOKEN_PATTERN.findall(sql), "", ""]
+    found: set[int | str] = set()
+    count: int = 0
+    for index, token in enumerate(tokens):
+        if not is_parameter(token):
+            continue
+        key: int | str = count if token == "?" else token[1:]
+        count += token == "?"
+        if bound_column(tokens, index) in ID_COLUMN_NAMES:
+            found.add(key)
+    return frozenset(found)
+
+
+def encode_params(sql: str, parameters: Any) -> Any:
+    """Encodes the parameters of a statement bound to an id column.
+
+    Only those are encoded, a name or description that looks like a uuid
+    is stored as the text it is.
+    """
+    ids: frozenset[int | str] = id_parameters(sql)
+    if not ids:
+        return parameters
+    if isinstance(parameters, dict):
+        return {
+            key: encode_id(value) if key in ids else value
+            for key, value in parameters.items()
+        }
+    return tuple(
+        encode_id(value) if index in ids else value
+        for index, value in enumerate(parameters)
+    )
+
+
+def decode_row(_cursor: Cursor, row: tuple) -> tuple:
+    """Row factory decoding the ids of a result row."""
+    return tuple(
+        [
+            format_blob_id(value)
+            if type(value) is bytes and len(value) == 16
+            else value
+            for value in row
+        ]
+    )
+
+
+class IdCursor(Cursor):
+    """This class is a cursor storing uuids as blobs and returning them as text.
+
+    The parameters bound to id columns are encoded with encode_id and
+    result rows decoded with decode_id, so controllers never see the blob
+    form.
+    """
+
+    def __init__(self, connection: Connection) -> None:
+        """Initialize the cursor with the decoding row factory."""
+        super().__init__(connection)
+        self.row_factory = decode_row
+
+    def execute(self, sql: str, parameters: Any = (), /) -> "IdCursor":
+        """Runs a statement with its ids encoded."""
+        return super().execute(sql, encode_params(sql, parameters))
+
+    def executemany(self, sql: str, seq_of_parameters: Iterable[Any], /) -> "IdCursor":
+        """Runs a statement for every parameter set, with the ids encoded."""
+        return super().executemany(
+            sql, (encode_params(sql, parameters) for parameters in seq_of_parameters)
+        )
+
+
+def store_ids_as_blobs(data_cursor: Cursor) -> None:
+    """Converts every uuid column to 16 byte blobs."""
+    data_cursor.connection.create_function(
+        "encode_id", 1, encode_id, deterministic=True
+    )
+    for table, columns in ID_COLUMNS.items():
+        assignments: str = ", ".join(f"{column} = encode_id({column})" for column in columns)
+        data_cursor.execute(f"UPDATE {table} SET {assignments};")
+
+
+if __name__ == "__main__":
+    print("This module is not intended to be run directly.")
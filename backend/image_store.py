@@ -0,0 +1,96 @@
+# coding: utf-8
+"""This module stores images under the sha256 of their content.
+
+An image lives at data/images/ab/cd/<sha256>.<ext>, so identical uploads
+share one file. The image table counts the user and task rows pointing at
+each file, kept up to date by triggers, and a file is deleted once its
+count drops to zero.
+"""
+
+from hashlib import sha256
+from os import fdopen, makedirs, remove, replace
+from os.path import dirname, exists, join
+from tempfile import mkstemp
+from typing import IO
+
+from log import make_new_log
+from utils import locked_db_operation, DEFAULT_DB_PATH
+from validator import UPLOAD_FOLDER
+
+# Uploads are hashed and written in chunks of this many bytes.
+IMAGE_CHUNK_SIZE: int = 64 * 1024
+
+
+def image_path(digest: str, extension: str) -> str:
+    """Makes the path of an image from the hex sha256 of its content."""
+    return join(UPLOAD_FOLDER, digest[:2], digest[2:4], f"{digest}.{extension}")
+
+
+def hash_upload(stream: IO[bytes], extension: str) -> tuple[str, str]:
+    """Writes an upload to a temporary file while hashing it.
+
+    Returns the temporary file and the path the image belongs at.
+    """
+    handle, temp_path = mkstemp(dir=UPLOAD_FOLDER, suffix=".part")
+    digest = sha256()
+    try:
+        with fdopen(handle, "wb") as temp_file:
+            while chunk := stream.read(IMAGE_CHUNK_SIZE):
+                digest.update(chunk)
+                temp_file.write(chunk)
+    except BaseException:
+        remove(temp_path)
+        raise
+    return temp_path, image_path(digest.hexdigest(), extension)
+
+
+def place_image(temp_path: str, path: str, db_name: str = DEFAULT_DB_PATH) -> None:
+    """Moves a hashed upload to its path, keeping the file already there.
+
+    Call it once the row taking the reference is committed. It holds the
+    write lock and only places the upload while the image row is still
+    referenced, so remove_unreferenced_images never misses the file.
+    Failures are only logged, the upload is deleted either way.
+    """
+    try:
+        with locked_db_operation(db_name) as data_cursor:
+            data_cursor.execute(
+                "SELECT 1 FROM image WHERE path = ? AND refs > 0;", (path,)
+            )
+            if data_cursor.fetchone() is not None and not exists(path):
+                makedirs(dirname(path), exist_ok=True)
+                replace(temp_path, path)
+    except Exception as err:
+        make_new_log("place_image", err)
+    finally:
+        discard_upload(temp_path)
+
+
+def discard_upload(temp_path: str) -> None:
+    """Deletes the temporary file of an upload that was not placed."""
+    if exists(temp_path):
+        remove(temp_path)
+
+
+def remove_unreferenced_images(db_name: str = DEFAULT_DB_PATH) -> int:
+    """Deletes the image files nothing points at anymore, returns how many.
+
+    Meant to run after a commit dropping references. Failures are only
+    logged, the files are picked up again by the next call.
+    """
+    try:
+        with locked_db_operation(db_name) as data_cursor:
+            data_cursor.execute("SELECT path FROM image WHERE refs <= 0;")
+            paths: list[str] = [row[0] for row in data_cursor.fetchall()]
+            for path in paths:
+                if exists(path):
+                    remove(path)
+            data_cursor.execute("DELETE FROM image WHERE refs <= 0;")
+    except Exception as err:
+        make_new_log("remove_unreferenced_images", err)
+        return 0
+    return len(paths)
+
+
+if __name__ == "__main__":
+    print("This module is not intended to be run directly.")
@@ -6,21 +6,36 @@ from typing import Any
 from flask import Flask, request, jsonify, Response, send_file, send_from_directory
 
 # from werkzeug.utils import secure_filename
-from validator import Validator
-
-from utils import error_handling_decorator, make_new_log
+from validator import MEMBERSHIP_CACHE, Validator
+from db_pool import DEFAULT_PRAGMA_PROFILE
+from controller_session import SESSION_CACHE
+from controller_invite import start_invite_sweeper
+
+from error import BackendError
+from utils import (
+    error_handling_decorator,
+    finish_request_transaction,
+    get_session_user,
+    make_new_log,
+    read_only,
+    release_request_connection,
+)
 
 from handler_user import UserHandle
 from handler_task import TaskHandle
 from handler_group import GroupHandle
 from handler_invite import InviteHandle
 from handler_image import ImageHandle
+from handler_session import SessionHandle
+from handler_dashboard import DashboardHandle
 
 app: Flask = Flask(__name__)
 
 UPLOAD_FOLDER: str = "data/images"
 ALLOWED_EXTENSIONS: set[str] = {"png", "jpg", "jpeg"}
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
+app.after_request(finish_request_transaction)
+app.teardown_request(release_request_connection)
 
 
 def allowed_file(filename):
@@ -42,6 +57,33 @@ def handle_root() -> Response:
     return respose_json
 
 
+@app.route("/cache_stats", methods=["GET"])
+@read_only
+@error_handling_decorator("cache_stats")
+def handle_cache_stats() -> Response:
+    """Reports the size and hit rate of the in-process caches to a signed in user."""
+    if get_session_user() is None:
+        raise BackendError("Backend Error: Session is invalid or expired", "315")
+    return jsonify(
+        [
+            {
+                "error_no": "0",
+                "message": "success",
+                "membership": MEMBERSHIP_CACHE.stats(),
+                "session": SESSION_CACHE.stats(),
+            }
+        ]
+    )
+
+
+@app.before_request
+@error_handling_decorator("load_session")
+def load_session() -> Response | None:
+    """Authenticates the session token of the request, if it has one."""
+    SessionHandle(request).load_session_request()
+    return None
+
+
 # ----- User Handlers ----
 
 
@@ -57,7 +99,7 @@ def handle_signup() -> Response:
 @error_handling_decorator("login")
 def handle_login() -> Response:
     """Login a user."""
-    user_info: dict[str, str] = UserHandle(request).login_user_request()
+    user_info: dict[str, Any] = UserHandle(request).login_user_request()
     return jsonify(
         [
             {
@@ -65,11 +107,21 @@ def handle_login() -> Response:
                 "message": "success",
                 "user_id": user_info["user_id"],
                 "username": user_info["username"],
+                "token": user_info["token"],
+                "expires_at": user_info["expires_at"],
             }
         ]
     )
 
 
+@app.route("/logout", methods=["POST"])
+@error_handling_decorator("logout")
+def handle_logout() -> Response:
+    """Ends the session of the request."""
+    SessionHandle(request).logout_request()
+    return jsonify([{"error_no": "0", "message": "success"}])
+
+
 @app.route("/edit_user", methods=["POST"])
 @error_handling_decorator("edit_user")
 def handle_edit_user() -> Response:
@@ -113,23 +165,60 @@ def handle_delete_task() -> Response:
     return jsonify([{"error_no": "0", "message": "success"}])
 
 
+@app.route("/complete_task", methods=["POST"])
+@error_handling_decorator("complete_task")
+def handle_complete_task() -> Response:
+    """Complete or reopen one task, or several at once."""
+    updated: int = TaskHandle(request).complete_task_request()
+    return jsonify([{"error_no": "0", "message": "success", "updated": updated}])
+
+
 @app.route("/get_user_task", methods=["POST"])
+@read_only
 @error_handling_decorator("get_user_task")
 def handle_get_user_task() -> Response:
     """Get all tasks for a user."""
-    tasks: dict[str, dict[str, Any]] = TaskHandle(request).get_user_task_request()
-    return jsonify([{"error_no": "0", "message": "success", "tasks": tasks}])
+    page: dict[str, Any] = TaskHandle(request).get_user_task_request()
+    return jsonify([{"error_no": "0", "message": "success", **page}])
 
 
 @app.route("/get_group_task", methods=["POST"])
+@read_only
 @error_handling_decorator("get_group_task")
 def handle_get_group_task() -> Response:
     """Get all tasks for a specific group."""
-    tasks: dict[str, dict[str, Any]] = TaskHandle(request).get_group_task_request()
-    return jsonify([{"error_no": "0", "message": "success", "tasks": tasks}])
+    page: dict[str, Any] = TaskHandle(request).get_group_task_request()
+    return jsonify([{"error_no": "0", "message": "success", **page}])
+
+
+@app.route("/tasks/batch", methods=["POST"])
+@error_handling_decorator("tasks_batch")
+def handle_tasks_batch() -> Response:
+    """Apply a list of task operations in one transaction."""
+    results: list[dict[str, Any]] = TaskHandle(request).batch_tasks_request()
+    return jsonify([{"error_no": "0", "message": "success", "results": results}])
+
+
+@app.route("/task_calendar_summary", methods=["POST"])
+@read_only
+@error_handling_decorator("task_calendar_summary")
+def handle_task_calendar_summary() -> Response:
+    """Get the number of tasks on each day of a month."""
+    days: dict[str, dict] = TaskHandle(request).get_calendar_summary_request()
+    return jsonify([{"error_no": "0", "message": "success", "days": days}])
+
+
+@app.route("/sync_tasks", methods=["POST"])
+@read_only
+@error_handling_decorator("sync_tasks")
+def handle_sync_tasks() -> Response:
+    """Get the tasks changed since the cursor of the client."""
+    changes: dict[str, Any] = TaskHandle(request).sync_tasks_request()
+    return jsonify([{"error_no": "0", "message": "success", **changes}])
 
 
 @app.route("/get_image", methods=["POST"])
+@read_only
 @error_handling_decorator("get_image")
 def handle_get_image() -> Response:
     """Get an image."""
@@ -140,6 +229,7 @@ def handle_get_image() -> Response:
 
 
 @app.route("/get_group_list", methods=["POST"])
+@read_only
 @error_handling_decorator("get_group_list")
 def handle_get_group_list() -> Response:
     """Get all groups for a user."""
@@ -172,6 +262,7 @@ def handle_delete_group() -> Response:
 
 
 @app.route("/get_group_members", methods=["POST"])
+@read_only
 @error_handling_decorator("get_group_members")
 def handle_get_group_members() -> Response:
     """Get all members of a specific group."""
@@ -190,6 +281,14 @@ def handle_create_invite() -> Response:
     return jsonify([{"error_no": "0", "message": "success", "invite_id": invite_id}])
 
 
+@app.route("/create_invites", methods=["POST"])
+@error_handling_decorator("create_invites")
+def handle_create_invites() -> Response:
+    """Invite many users to a group at once."""
+    results: list[dict[str, Any]] = InviteHandle(request).create_invites_request()
+    return jsonify([{"error_no": "0", "message": "success", "results": results}])
+
+
 @app.route("/respond_invite", methods=["POST"])
 @error_handling_decorator("respond_invite")
 def handle_respond_invite() -> Response:
@@ -199,6 +298,7 @@ def handle_respond_invite() -> Response:
 
 
 @app.route("/get_pending", methods=["POST"])
+@read_only
 @error_handling_decorator("get_pending")
 def handle_get_pending() -> Response:
     """Get all pending invites for a user."""
@@ -215,17 +315,31 @@ def handle_delete_invite() -> Response:
 
 
 @app.route("/sent_invite", methods=["POST"])
+@read_only
 @error_handling_decorator("sent_invite")
 def handle_sent_invite() -> Response:
     """Get all sent invites for a user."""
-    invites: dict[str, dict[str, Any]] = InviteHandle(request).sent_invite_request()
-    return jsonify([{"error_no": "0", "message": "success", "invites": invites}])
+    page: dict[str, Any] = InviteHandle(request).sent_invite_request()
+    return jsonify([{"error_no": "0", "message": "success", **page}])
+
+
+# ----- Dashboard Handlers ----
+
+
+@app.route("/dashboard", methods=["POST"])
+@read_only
+@error_handling_decorator("dashboard")
+def handle_dashboard() -> Response:
+    """Get the groups, pending invites and tasks of a user at once."""
+    dashboard: dict[str, Any] = DashboardHandle(request).get_dashboard_request()
+    return jsonify([{"error_no": "0", "message": "success", **dashboard}])
 
 
 # ----- File Upload Download ----
 
 
 @app.route("/get_user_image", methods=["POST"])
+@read_only
 @error_handling_decorator("get_user_image")
 def handle_get_user_image() -> Response:
     """Get an image."""
@@ -235,6 +349,7 @@ def handle_get_user_image() -> Response:
 
 
 @app.route("/get_task_image", methods=["POST"])
+@read_only
 @error_handling_decorator("get_task_image")
 def handle_get_task_image() -> Response:
     """Get an image."""
@@ -301,7 +416,9 @@ if __name__ == "__main__":
     make_new_log("main", "Server started")  # type: ignore
     try:
         print("Setting Up the Server...")
+        print(f"Using the {DEFAULT_PRAGMA_PROFILE} database profile.")
         Validator().initializer()
+        start_invite_sweeper()
         print("Server Initialized!")
         print("Starting the server...")
         app.run()
@@ -0,0 +1,406 @@
+# coding: utf-8
+"""This module upgrades the database schema one version at a time."""
+
+from os import close, remove
+from sys import argv
+from sqlite3 import connect, Connection, Cursor
+from tempfile import mkstemp
+from threading import Thread
+from time import perf_counter, sleep
+from typing import Callable
+
+from error import BackendError
+from id_codec import store_ids_as_blobs
+from log import make_new_log
+from utils import db_operation, DEFAULT_DB_PATH
+
+
+class Backfill:
+    """This class fills a column of an existing table in small batches.
+
+    A row is pending while it matches the pending condition, so a backfill
+    is done once no row matches and can be restarted at any time.
+    """
+
+    def __init__(
+        self, table: str, assignment: str, pending: str, batch_size: int = 500
+    ) -> None:
+        """Initialize the backfill."""
+        self.table: str = table
+        self.assignment: str = assignment
+        self.pending: str = pending
+        self.batch_size: int = batch_size
+
+    def run_batch(self, data_cursor: Cursor) -> int:
+        """Fills one batch of pending rows and returns how many were filled."""
+        data_cursor.execute(
+            f"UPDATE {self.table} SET {self.assignment} WHERE rowid IN "
+            f"(SELECT rowid FROM {self.table} WHERE {self.pending} LIMIT ?);",
+            (self.batch_size,),
+        )
+        return data_cursor.rowcount
+
+
+class Migration:
+    """This class holds one version of the schema.
+
+    Steps are SQL statements or functions taking a cursor. Every step must
+    be idempotent, the steps of a migration run in a single transaction and
+    the version is stored in PRAGMA user_version in that same transaction.
+    The backfill, if any, runs afterwards in batches while the server is up,
+    so code must cope with rows it has not reached yet.
+    """
+
+    def __init__(
+        self,
+        version: int,
+        description: str,
+        steps: list[str | Callable[[Cursor], None]],
+        backfill: Backfill | None = None,
+    ) -> None:
+        """Initialize the migration."""
+        self.version: int = version
+        self.description: str = description
+        self.steps: list[str | Callable[[Cursor], None]] = steps
+        self.backfill: Backfill | None = backfill
+
+    def apply(self, data_cursor: Cursor) -> None:
+        """Runs every step and records the new version."""
+        for step in self.steps:
+            run_step(data_cursor, step)
+        data_cursor.execute(f"PRAGMA user_version = {self.version};")
+
+
+def run_step(data_cursor: Cursor, step: str | Callable[[Cursor], None]) -> None:
+    """Runs a single migration step."""
+    if isinstance(step, str):
+        data_cursor.execute(step)
+    else:
+        step(data_cursor)
+
+
+def step_name(step: str | Callable[[Cursor], None]) -> str:
+    """Gets a readable name for a migration step."""
+    if isinstance(step, str):
+        return step
+    return step.__doc__ or step.__name__
+
+
+def add_column(table: str, column: str, definition: str) -> Callable[[Cursor], None]:
+    """Makes a step adding a column unless the table already has it."""
+
+    def step(data_cursor: Cursor) -> None:
+        data_cursor.execute(f"PRAGMA table_info({table});")
+        if column not in {row[1] for row in data_cursor.fetchall()}:
+            data_cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition};")
+
+    step.__doc__ = f"ALTER TABLE {table} ADD COLUMN {column} {definition};"
+    return step
+
+
+def image_ref_triggers(table: str) -> list[str]:
+    """Makes the triggers counting the references of a table to the image table."""
+    add_ref: str = (
+        "INSERT INTO image VALUES (NEW.image_path, 1) "
+        "ON CONFLICT(path) DO UPDATE SET refs = refs + 1"
+    )
+    drop_ref: str = "UPDATE image SET refs = refs - 1 WHERE path = OLD.image_path"
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS {table}_image_insert AFTER INSERT ON {table} "
+        f"WHEN NEW.image_path != '' BEGIN {add_ref}; END;",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_image_add AFTER UPDATE OF image_path "
+        f"ON {table} WHEN NEW.image_path IS NOT OLD.image_path "
+        f"AND NEW.image_path != '' BEGIN {add_ref}; END;",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_image_drop AFTER UPDATE OF image_path "
+        f"ON {table} WHEN NEW.image_path IS NOT OLD.image_path "
+        f"AND OLD.image_path != '' BEGIN {drop_ref}; END;",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_image_delete AFTER DELETE ON {table} "
+        f"WHEN OLD.image_path != '' BEGIN {drop_ref}; END;",
+    ]
+
+
+# Unix time in SQL, SQLite before 3.42 has no unixepoch('subsec').
+SQL_NOW: str = "((julianday('now') - 2440587.5) * 86400.0)"
+
+# Never edit a released migration, append a new version instead.
+MIGRATIONS: list[Migration] = [
+    Migration(
+        1,
+        "Add indexes for the hot lookups",
+        [
+            "CREATE INDEX IF NOT EXISTS idx_task_assign ON task(assign_uuid);",
+            "CREATE INDEX IF NOT EXISTS idx_task_assigner ON task(assigner_uuid);",
+            "CREATE INDEX IF NOT EXISTS idx_task_group ON task(group_uuid);",
+            "CREATE INDEX IF NOT EXISTS idx_group_user_user "
+            "ON group_user(user_id, group_id);",
+            "CREATE INDEX IF NOT EXISTS idx_group_user_group "
+            "ON group_user(group_id, user_id);",
+            "CREATE INDEX IF NOT EXISTS idx_user_email ON user(email, password);",
+            "CREATE INDEX IF NOT EXISTS idx_user_username ON user(username);",
+            "CREATE INDEX IF NOT EXISTS idx_group_invites_invitee "
+            "ON group_invites(invitee_id, group_id);",
+            "CREATE INDEX IF NOT EXISTS idx_group_invites_group "
+            "ON group_invites(group_id);",
+        ],
+    ),
+    Migration(
+        2,
+        "Add the image columns missing from early databases",
+        [
+            add_column("user", "image_path", "TEXT"),
+            add_column("task", "image_path", "TEXT"),
+        ],
+    ),
+    Migration(
+        3,
+        "Add the login session table",
+        [
+            "CREATE TABLE IF NOT EXISTS session"
+            "(token_hash TEXT PRIMARY KEY, user_id TEXT NOT NULL, "
+            "expires_at REAL NOT NULL);",
+            "CREATE INDEX IF NOT EXISTS idx_session_user ON session(user_id);",
+        ],
+    ),
+    Migration(
+        4,
+        "Store the uuid columns as 16 byte blobs",
+        [store_ids_as_blobs],
+    ),
+    Migration(
+        5,
+        "Track task changes for the delta sync",
+        [
+            add_column("task", "row_version", "INTEGER NOT NULL DEFAULT 0"),
+            add_column("task", "updated_at", "REAL"),
+            "CREATE TABLE IF NOT EXISTS task_sync"
+            "(id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL, "
+            "pruned_version INTEGER NOT NULL);",
+            "INSERT OR IGNORE INTO task_sync VALUES (1, 0, 0);",
+            "CREATE TABLE IF NOT EXISTS task_tombstone"
+            "(uuid TEXT NOT NULL, group_uuid TEXT, assign_uuid TEXT, "
+            "row_version INTEGER NOT NULL, deleted_at REAL NOT NULL);",
+            # Every write takes the next version of the single task_sync row.
+            "CREATE TRIGGER IF NOT EXISTS task_sync_insert AFTER INSERT ON task "
+            "BEGIN "
+            "UPDATE task_sync SET version = version + 1; "
+            "UPDATE task SET row_version = (SELECT version FROM task_sync), "
+            f"updated_at = {SQL_NOW} WHERE rowid = NEW.rowid; "
+            "END;",
+            # A task leaving a group or an assignee is a delete for them.
+            "CREATE TRIGGER IF NOT EXISTS task_sync_update AFTER UPDATE ON task "
+            "WHEN NEW.row_version IS OLD.row_version "
+            "BEGIN "
+            "UPDATE task_sync SET version = version + 1; "
+            "INSERT INTO task_tombstone SELECT OLD.uuid, OLD.group_uuid, "
+            f"OLD.assign_uuid, version, {SQL_NOW} FROM task_sync "
+            "WHERE OLD.group_uuid IS NOT NEW.group_uuid "
+            "OR OLD.assign_uuid IS NOT NEW.assign_uuid; "
+            "UPDATE task SET row_version = (SELECT version FROM task_sync), "
+            f"updated_at = {SQL_NOW} WHERE rowid = NEW.rowid; "
+            "END;",
+            "CREATE TRIGGER IF NOT EXISTS task_sync_delete AFTER DELETE ON task "
+            "BEGIN "
+            "UPDATE task_sync SET version = version + 1; "
+            "INSERT INTO task_tombstone SELECT OLD.uuid, OLD.group_uuid, "
+            f"OLD.assign_uuid, version, {SQL_NOW} FROM task_sync; "
+            "END;",
+            # The version indexes cover the group and assignee lookups too.
+            "DROP INDEX IF EXISTS idx_task_group;",
+            "DROP INDEX IF EXISTS idx_task_assign;",
+            "CREATE INDEX IF NOT EXISTS idx_task_group_version "
+            "ON task(group_uuid, row_version);",
+            "CREATE INDEX IF NOT EXISTS idx_task_assign_version "
+            "ON task(assign_uuid, row_version);",
+            "CREATE INDEX IF NOT EXISTS idx_task_tombstone_group "
+            "ON task_tombstone(group_uuid, row_version);",
+            "CREATE INDEX IF NOT EXISTS idx_task_tombstone_assign "
+            "ON task_tombstone(assign_uuid, row_version);",
+            "CREATE INDEX IF NOT EXISTS idx_task_tombstone_deleted "
+            "ON task_tombstone(deleted_at);",
+        ],
+    ),
+    Migration(
+        6,
+        "Add the due date indexes for the calendar windows",
+        [
+            # The uuid orders tasks due at the same time.
+            "CREATE INDEX IF NOT EXISTS idx_task_group_due_uuid "
+            "ON task(group_uuid, due, uuid);",
+            "CREATE INDEX IF NOT EXISTS idx_task_assign_due_uuid "
+            "ON task(assign_uuid, due, uuid);",
+        ],
+    ),
+    Migration(
+        7,
+        "Add the indexes for the sorted task pages",
+        [
+            # Keyset pages compare (column, uuid) pairs, NULL would end them.
+            "UPDATE task SET due = 0 WHERE due IS NULL;",
+            "UPDATE task SET priority = 0 WHERE priority IS NULL;",
+            "CREATE INDEX IF NOT EXISTS idx_task_group_priority_uuid "
+            "ON task(group_uuid, priority, uuid);",
+            "CREATE INDEX IF NOT EXISTS idx_task_assign_priority_uuid "
+            "ON task(assign_uuid, priority, uuid);",
+            "CREATE INDEX IF NOT EXISTS idx_task_group_name_uuid "
+            "ON task(group_uuid, name, uuid);",
+            "CREATE INDEX IF NOT EXISTS idx_task_assign_name_uuid "
+            "ON task(assign_uuid, name, uuid);",
+        ],
+    ),
+    Migration(
+        8,
+        "Add the index for the pages of sent invites",
+        [
+            "DROP INDEX IF EXISTS idx_group_invites_group;",
+            "CREATE INDEX IF NOT EXISTS idx_group_invites_group_invite "
+            "ON group_invites(group_id, invite_id);",
+        ],
+    ),
+    Migration(
+        9,
+        "Store when invites were created as unix time, for their expiry",
+        [
+            add_column("group_invites", "created_at", "REAL"),
+            "CREATE INDEX IF NOT EXISTS idx_group_invites_created "
+            "ON group_invites(created_at);",
+        ],
+        # day_created holds an ISO text on most rows, unix time on a few.
+        backfill=Backfill(
+            "group_invites",
+            "created_at = CASE WHEN typeof(day_created) IN ('integer', 'real') "
+            "THEN day_created "
+            f"ELSE COALESCE((julianday(day_created) - 2440587.5) * 86400.0, {SQL_NOW}) END",
+            "created_at IS NULL",
+        ),
+    ),
+    Migration(
+        10,
+        "Count the references to every image file",
+        [
+            "CREATE TABLE IF NOT EXISTS image"
+            "(path TEXT PRIMARY KEY, refs INTEGER NOT NULL);",
+            # The files to delete, the index stays as small as they are few.
+            "CREATE INDEX IF NOT EXISTS idx_image_unreferenced "
+            "ON image(path) WHERE refs <= 0;",
+            "INSERT OR IGNORE INTO image SELECT image_path, COUNT(*) FROM "
+            "(SELECT image_path FROM user UNION ALL SELECT image_path FROM task) "
+            "WHERE image_path != '' GROUP BY image_path;",
+            *image_ref_triggers("user"),
+            *image_ref_triggers("task"),
+        ],
+    ),
+]
+LATEST_VERSION: int = MIGRATIONS[-1].version
+
+
+def get_schema_version(data_cursor: Cursor) -> int:
+    """Gets the schema version stored in the database."""
+    return data_cursor.execute("PRAGMA user_version;").fetchone()[0]
+
+
+def apply_migrations(data_cursor: Cursor) -> int:
+    """Runs every pending migration on one cursor and returns the new version."""
+    version: int = get_schema_version(data_cursor)
+    for migration in MIGRATIONS:
+        if migration.version > version:
+            migration.apply(data_cursor)
+            version = migration.version
+    return version
+
+
+def migrate(db_name: str = DEFAULT_DB_PATH) -> int:
+    """Runs every pending migration, each in its own transaction."""
+    with db_operation(db_name) as data_cursor:
+        version: int = get_schema_version(data_cursor)
+    if version > LATEST_VERSION:
+        raise BackendError(
+            f"Backend Error: Database version {version} is newer than the backend",
+            "201",
+        )
+    for migration in MIGRATIONS:
+        if migration.version <= version:
+            continue
+        with db_operation(db_name) as data_cursor:
+            migration.apply(data_cursor)
+        version = migration.version
+    return version
+
+
+def run_backfills(db_name: str = DEFAULT_DB_PATH, pause: float = 0.05) -> None:
+    """Runs every backfill to completion, one short transaction per batch."""
+    for migration in MIGRATIONS:
+        if migration.backfill is None:
+            continue
+        while True:
+            with db_operation(db_name) as data_cursor:
+                filled: int = migration.backfill.run_batch(data_cursor)
+            if filled == 0:
+                break
+            sleep(pause)
+
+
+def start_backfills(db_name: str = DEFAULT_DB_PATH) -> Thread:
+    """Runs the backfills in the background so the server can start."""
+
+    def run() -> None:
+        try:
+            run_backfills(db_name)
+        except Exception as err:
+            make_new_log("start_backfills", err)
+
+    backfill_thread: Thread = Thread(target=run, name="backfill", daemon=True)
+    backfill_thread.start()
+    return backfill_thread
+
+
+def dry_run(db_name: str = DEFAULT_DB_PATH) -> list[tuple[int, str, float]]:
+    """Times every pending step against a copy of the database.
+
+    The database itself is never written, the copy is deleted afterwards.
+    """
+    handle, copy_name = mkstemp(suffix=".db")
+    close(handle)
+    timings: list[tuple[int, str, float]] = []
+    try:
+        source_con: Connection = connect(db_name)
+        copy_con: Connection = connect(copy_name, isolation_level=None)
+        source_con.backup(copy_con)
+        source_con.close()
+        data_cursor: Cursor = copy_con.cursor()
+        version: int = get_schema_version(data_cursor)
+        for migration in MIGRATIONS:
+            if migration.version <= version:
+                continue
+            data_cursor.execute("BEGIN;")
+            for step in migration.steps:
+                started: float = perf_counter()
+                run_step(data_cursor, step)
+                timings.append(
+                    (migration.version, step_name(step), perf_counter() - started)
+                )
+            data_cursor.execute(f"PRAGMA user_version = {migration.version};")
+            data_cursor.execute("COMMIT;")
+            if migration.backfill is not None:
+                started = perf_counter()
+                while migration.backfill.run_batch(data_cursor):
+                    pass
+                timings.append(
+                    (
+                        migration.version,
+                        f"backfill {migration.backfill.table}",
+                        perf_counter() - started,
+                    )
+                )
+        copy_con.close()
+    finally:
+        remove(copy_name)
+    return timings
+
+
+if __name__ == "__main__":
+    if len(argv) < 2 or argv[1] != "--dry-run":
+        raise SystemExit("Usage: python migration.py --dry-run [DATABASE_PATH]")
+    for step_version, name, seconds in dry_run(
+        argv[2] if len(argv) > 2 else DEFAULT_DB_PATH
+    ):
+        print(f"v{step_version} {seconds * 1000:9.2f} ms  {name}")
@@ -0,0 +1,134 @@
+# coding: utf-8
+"""This script checks that every hot query is served by an index."""
+
+from sqlite3 import connect, Connection
+
+from controller_group import GROUP_LISTING_QUERY, GROUP_MEMBERS_QUERY
+from controller_invite import (
+    DELETE_INVITE_QUERY,
+    JOIN_GROUP_QUERY,
+    PENDING_INVITES_QUERY,
+    SENT_INVITES_QUERY,
+    TAKE_INVITE_QUERY,
+    sent_invite_page,
+)
+from controller_task import (
+    TASK_LISTING_QUERY,
+    TASK_SORTS,
+    calendar_summary_query,
+    complete_task_query,
+    make_page_cursor,
+    sync_task_query,
+    task_page,
+    task_update_query,
+    sync_tombstone_query,
+    task_window,
+)
+from controller_user import DELETE_USER_TASKS_QUERY
+from migration import apply_migrations
+from validator import (
+    AUTHORIZE_QUERY,
+    CHECK_EMAIL_QUERY,
+    CHECK_INVITE_QUERY,
+    CHECK_LOGIN_QUERY,
+    CHECK_USERNAME_QUERY,
+    CREATE_GROUP_INVITES_TABLE,
+    CREATE_GROUP_TABLE,
+    CREATE_GROUP_USER_TABLE,
+    CREATE_TASK_TABLE,
+    CREATE_USER_TABLE,
+    USER_GROUPS_QUERY,
+)
+
+# Queries run on (almost) every request, taken from the constants the
+# controllers and the validator run, so a changed query is checked as is.
+# CI runs this script and fails when a query scans a whole table.
+HOT_QUERIES: dict[str, str] = {
+    "authorize": AUTHORIZE_QUERY,
+    "get_user_groups": USER_GROUPS_QUERY,
+    "check_login": CHECK_LOGIN_QUERY,
+    "check_email": CHECK_EMAIL_QUERY,
+    "check_username": CHECK_USERNAME_QUERY,
+    "check_invite": CHECK_INVITE_QUERY,
+    "get_user_task_control": TASK_LISTING_QUERY
+    + "WHERE task.assign_uuid = ?"
+    + "".join(task_page("due", None, None)[:2])
+    + ";",
+    "get_group_task_control": TASK_LISTING_QUERY
+    + "WHERE task.group_uuid = ?"
+    + "".join(task_page("due", None, None)[:2])
+    + ";",
+    "get_user_task_control window": TASK_LISTING_QUERY
+    + "WHERE task.assign_uuid = ?"
+    + task_window(0, 0, include_completed=False)[0]
+    + ";",
+    "get_group_task_control window": TASK_LISTING_QUERY
+    + "WHERE task.group_uuid = ?"
+    + task_window(0, 0, include_completed=False)[0]
+    + ";",
+    **{
+        f"get_group_task_control {sort} page": TASK_LISTING_QUERY
+        + "WHERE task.group_uuid = ?"
+        + "".join(task_page(sort, make_page_cursor(sort, ("",) * 17), 50)[:2])
+        + ";"
+        for sort in TASK_SORTS
+    },
+    "edit_task_control": task_update_query(("completed",), guarded=True),
+    "toggle_complete_task_control": complete_task_query(task_count=3),
+    "get_calendar_summary_control": calendar_summary_query(group_count=3),
+    "sync_task_control": sync_task_query(group_count=3),
+    "sync_task_control tombstones": sync_tombstone_query(group_count=3),
+    "get_group_control": GROUP_LISTING_QUERY,
+    "get_group_members_control": GROUP_MEMBERS_QUERY,
+    "get_pending_control": PENDING_INVITES_QUERY,
+    "sent_invite_control": SENT_INVITES_QUERY + sent_invite_page(None, None)[0],
+    "sent_invite_control page": SENT_INVITES_QUERY + sent_invite_page("0", 50)[0],
+    "respond_invite_control": TAKE_INVITE_QUERY,
+    "delete_invite_control": DELETE_INVITE_QUERY,
+    "respond_invite_control join": JOIN_GROUP_QUERY,
+    "delete_user_control": DELETE_USER_TASKS_QUERY,
+}
+
+
+def build_schema(data_con: Connection) -> None:
+    """Creates the tables and runs every migration on an empty database."""
+    for statement in (
+        CREATE_TASK_TABLE,
+        CREATE_USER_TABLE,
+        CREATE_GROUP_TABLE,
+        CREATE_GROUP_USER_TABLE,
+        CREATE_GROUP_INVITES_TABLE,
+    ):
+        data_con.execute(statement)
+    apply_migrations(data_con.cursor())
+    data_con.commit()
+
+
+def find_table_scans(data_con: Connection) -> dict[str, list[str]]:
+    """Returns the plan steps of every hot query that scans a whole table."""
+    scans: dict[str, list[str]] = {}
+    for name, query in HOT_QUERIES.items():
+        params: tuple = (None,) * query.count("?")
+        plan: list[tuple] = data_con.execute(
+            f"EXPLAIN QUERY PLAN {query}", params
+        ).fetchall()
+        full_scans: list[str] = [
+            row[3]
+            for row in plan
+            if row[3].startswith("SCAN") and row[3] != "SCAN CONSTANT ROW"
+        ]
+        if full_scans:
+            scans[name] = full_scans
+    return scans
+
+
+if __name__ == "__main__":
+    test_con: Connection = connect(":memory:")
+    build_schema(test_con)
+    table_scans: dict[str, list[str]] = find_table_scans(test_con)
+    test_con.close()
+    for query_name, steps in table_scans.items():
+        print(f"{query_name}: {'; '.join(steps)}")
+    if table_scans:
+        raise SystemExit(f"{len(table_scans)} hot queries scan a whole table.")
+    print(f"All {len(HOT_QUERIES)} hot queries use an index.")
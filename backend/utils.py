@@ -3,21 +3,109 @@
 
 from contextlib import contextmanager
 from functools import wraps
-from sqlite3 import connect, Cursor
+from os import environ, urandom
+from sqlite3 import Connection, Cursor, IntegrityError
+from time import time_ns
 from typing import Callable, Any, Generator
+from uuid import UUID, uuid4
 
-from flask import Request, jsonify
+from flask import Request, Response, g, has_request_context, jsonify, request
 
+from db_pool import get_pool, ConnectionPool
 from error import BackendError
+from id_codec import IdCursor
 from log import make_new_log
 
 DEFAULT_DB_PATH = "data/data.db"
+# "uuid7" ids grow with time, so new rows land at the end of the primary key
+# B-tree instead of on random pages. "uuid4" keeps fully random ids.
+ID_SCHEME: str = environ.get("ROOMIEBUDDY_ID_SCHEME", "uuid7")
+ID_ATTEMPTS: int = 5
+# The view functions marked with read_only.
+READ_ONLY_ENDPOINTS: set[str] = set()
+
+
+def uuid7() -> UUID:
+    """Makes a time ordered UUID, version 7 of RFC 9562."""
+    timestamp_ms: int = time_ns() // 1_000_000
+    random_bits: int = int.from_bytes(urandom(10), "big")
+    return UUID(
+        int=(timestamp_ms & 0xFFFF_FFFF_FFFF) << 80
+        | 0x7 << 76
+        | (random_bits >> 68) << 64
+        | 0b10 << 62
+        | random_bits & 0x3FFF_FFFF_FFFF_FFFF
+    )
+
+
+def new_id() -> str:
+    """Makes a new row id following ID_SCHEME."""
+    return str(uuid7() if ID_SCHEME == "uuid7" else uuid4())
+
+
+def insert_with_new_id(
+    data_cursor: Cursor, query: str, make_params: Callable[[str], tuple]
+) -> str:
+    """Inserts a row under a new id and returns the id.
+
+    The PRIMARY KEY settles collisions, a taken id fails the insert and
+    another id is drawn, so no lookup runs before the insert.
+    """
+    for _ in range(ID_ATTEMPTS):
+        row_id: str = new_id()
+        try:
+            data_cursor.execute(query, make_params(row_id))
+        except IntegrityError as err:
+            if "UNIQUE constraint failed" not in str(err):
+                raise
+            continue
+        return row_id
+    raise BackendError("Backend Error: Could not generate a unique id", "204")
+
+
+def insert_many_with_new_ids(
+    data_cursor: Cursor, query: str, rows: list[tuple]
+) -> list[str]:
+    """Inserts rows under new ids with one executemany and returns the ids.
+
+    The id is the first parameter of the query, rows hold the others. A
+    taken id fails the whole statement, so then the batch is undone to a
+    savepoint and every row goes through insert_with_new_id instead.
+    """
+    row_ids: list[str] = [new_id() for _ in rows]
+    data_cursor.execute("SAVEPOINT insert_many;")
+    try:
+        data_cursor.executemany(
+            query, [(row_id, *row) for row_id, row in zip(row_ids, rows)]
+        )
+    except IntegrityError as err:
+        data_cursor.execute("ROLLBACK TO insert_many;")
+        data_cursor.execute("RELEASE insert_many;")
+        if "UNIQUE constraint failed" not in str(err):
+            raise
+        return [
+            insert_with_new_id(data_cursor, query, lambda row_id, row=row: (row_id, *row))
+            for row in rows
+        ]
+    data_cursor.execute("RELEASE insert_many;")
+    return row_ids
+
+
+def get_session_user() -> str | None:
+    """Gets the user authenticated by the session token of the request."""
+    if not has_request_context():
+        return None
+    return g.get("session_user_id")
 
 
 def extract_request_data(
-    request: Request, required_fields: list[str]
+    request: Request, required_fields: list[str], session_auth: bool = True
 ) -> dict[str, Any]:
-    """Extract and validate request data."""
+    """Extract and validate request data.
+
+    With a session token the password may be left out, unless session_auth
+    is False for requests that must confirm the password.
+    """
     try:
         request_data: dict[str, Any] = request.get_json()
     except Exception as err:
@@ -27,6 +115,10 @@ def extract_request_data(
             error_code="199",
         ) from err
 
+    if session_auth and get_session_user() is not None:
+        request_data.setdefault("password", "")
+        required_fields = [field for field in required_fields if field != "password"]
+
     # Check for missing fields
     missing_fields = [field for field in required_fields if not request_data.get(field)]
     if missing_fields:
@@ -39,6 +131,42 @@ def extract_request_data(
     return request_data
 
 
+def optional_float(request_data: dict[str, Any], field: str) -> float | None:
+    """Gets an optional number from the request data."""
+    value: Any = request_data.get(field)
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError) as err:
+        raise BackendError(
+            message=f"The field {field} must be a number!", error_code="103"
+        ) from err
+
+
+def optional_int(request_data: dict[str, Any], field: str) -> int | None:
+    """Gets an optional whole number from the request data."""
+    value: Any = request_data.get(field)
+    if value is None or value == "":
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError) as err:
+        raise BackendError(
+            message=f"The field {field} must be a whole number!", error_code="103"
+        ) from err
+
+
+def request_flag(request_data: dict[str, Any], field: str, default: bool) -> bool:
+    """Gets an optional true or false value from the request data."""
+    value: Any = request_data.get(field)
+    if value is None or value == "":
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() not in {"0", "false", "no"}
+
+
 def error_handling_decorator(log_title: str) -> Callable:
     """Utility function to handle request and log errors."""
 
@@ -48,8 +176,10 @@ def error_handling_decorator(log_title: str) -> Callable:
             try:
                 return func(*args, **kwargs)
             except BackendError as err:
+                mark_request_rollback()
                 return jsonify([{"error_no": err.error_code, "message": err.message}])
             except Exception as err:
+                mark_request_rollback()
                 make_new_log(log_title, err)
                 return jsonify(
                     [{"error_no": "200", "message": "Trouble with backend! Sorry!"}]
@@ -60,21 +190,163 @@ def error_handling_decorator(log_title: str) -> Callable:
     return decorator
 
 
+def mark_request_rollback() -> None:
+    """Makes the current request roll back its transaction instead of committing."""
+    if has_request_context():
+        g.db_rollback = True
+
+
+def read_only(view: Callable) -> Callable:
+    """Marks a route that never writes, its transaction does not take the write lock."""
+    READ_ONLY_ENDPOINTS.add(view.__name__)
+    return view
+
+
+def _request_connection(db_name: str) -> Connection:
+    """Gets the connection of the current request, starting its transaction.
+
+    Under WAL a transaction that read and then writes fails with
+    SQLITE_BUSY_SNAPSHOT when another writer committed in between, and
+    busy_timeout does not retry that. So every request but the read only
+    ones takes the write lock up front, waiting for it with busy_timeout.
+    """
+    connections: dict[str, Connection] = g.setdefault("db_connections", {})
+    data_con: Connection | None = connections.get(db_name)
+    if data_con is None:
+        data_con = get_pool(db_name).acquire()
+        connections[db_name] = data_con
+        if request.endpoint in READ_ONLY_ENDPOINTS:
+            data_con.execute("BEGIN;")
+        else:
+            data_con.execute("BEGIN IMMEDIATE;")
+    return data_con
+
+
+def call_after_commit(callback: Callable[[], None]) -> None:
+    """Runs a callback once the data written so far is committed.
+
+    Outside a request every db_operation has already committed, so the
+    callback runs right away.
+    """
+    if not has_request_context() or "db_connections" not in g:
+        callback()
+        return
+    g.setdefault("db_after_commit", []).append(callback)
+
+
+def call_after_rollback(callback: Callable[[], None]) -> None:
+    """Runs a callback if the transaction of the request is rolled back.
+
+    Outside a request every db_operation has already committed, so the
+    callback is dropped.
+    """
+    if has_request_context() and "db_connections" in g:
+        g.setdefault("db_after_rollback", []).append(callback)
+
+
+def finish_request_transaction(response: Response) -> Response:
+    """Commits the transaction of the request once, or rolls it back."""
+    connections: dict[str, Connection] = g.pop("db_connections", {})
+    rollback: bool = g.pop("db_rollback", False)
+    callbacks: list[Callable[[], None]] = g.pop("db_after_commit", [])
+    undo_callbacks: list[Callable[[], None]] = g.pop("db_after_rollback", [])
+    failed: bool = False
+    for db_name, data_con in connections.items():
+        try:
+            if rollback:
+                data_con.rollback()
+            else:
+                data_con.commit()
+        except Exception as err:
+            make_new_log("Database", err)
+            failed = True
+        finally:
+            get_pool(db_name).release(data_con)
+    if rollback or failed:
+        for callback in undo_callbacks:
+            callback()
+    if failed:
+        return jsonify(
+            [{"error_no": "200", "message": "Trouble with backend! Sorry!"}]
+        )
+    if not rollback:
+        for callback in callbacks:
+            callback()
+    return response
+
+
+def release_request_connection(_error: BaseException | None = None) -> None:
+    """Gives back a connection the request did not finish, rolling it back."""
+    connections: dict[str, Connection] = g.pop("db_connections", {})
+    g.pop("db_after_commit", None)
+    undo_callbacks: list[Callable[[], None]] = g.pop("db_after_rollback", [])
+    for db_name, data_con in connections.items():
+        get_pool(db_name).release(data_con)
+    if connections:
+        for callback in undo_callbacks:
+            callback()
+
+
 @contextmanager
 def db_operation(db_name: str = DEFAULT_DB_PATH) -> Generator[Cursor, None, None]:
-    """Context manager for database connection."""
-    with connect(db_name) as data_con:
+    """Context manager for database connection.
+
+    Inside a request every call shares one connection and one transaction,
+    which finish_request_transaction commits once the request is handled.
+    Outside a request every call runs in its own pooled transaction.
+    """
+    in_request: bool = has_request_context()
+    pool: ConnectionPool = get_pool(db_name)
+    if in_request:
+        data_con: Connection = _request_connection(db_name)
+    else:
+        data_con = pool.acquire()
+        data_con.execute("BEGIN;")
+    data_cursor: Cursor = data_con.cursor(factory=IdCursor)
+    try:
+        yield data_cursor
+        if not in_request:
+            data_con.commit()
+    except Exception as err:
+        if in_request:
+            mark_request_rollback()
+        else:
+            data_con.rollback()
+        if isinstance(err, BackendError):
+            raise
+        make_new_log("Database", err)
+        raise BackendError(
+            message="Trouble with backend! Sorry, but please notify the devs!",
+            error_code="200",
+        ) from err
+    finally:
+        data_cursor.close()
+        if not in_request:
+            pool.release(data_con)
+
+
+@contextmanager
+def locked_db_operation(db_name: str = DEFAULT_DB_PATH) -> Generator[Cursor, None, None]:
+    """Context manager for a transaction of its own holding the write lock.
+
+    Unlike db_operation it never joins the transaction of the request, so it
+    also works in the callbacks run once the request committed.
+    """
+    pool: ConnectionPool = get_pool(db_name)
+    data_con: Connection = pool.acquire()
+    try:
+        data_con.execute("BEGIN IMMEDIATE;")
+        data_cursor: Cursor = data_con.cursor(factory=IdCursor)
         try:
-            data_cursor: Cursor = data_con.cursor()
             yield data_cursor
-        except Exception as err:
+            data_con.commit()
+        except Exception:
             data_con.rollback()
-            make_new_log("Database", err)
-            raise BackendError(
-                message="Trouble with backend! Sorry, but please notify the devs!",
-                error_code="200",
-            ) from err
-        data_con.commit()
+            raise
+        finally:
+            data_cursor.close()
+    finally:
+        pool.release(data_con)
 
 
 if __name__ == "__main__":
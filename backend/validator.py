@@ -1,10 +1,15 @@
 # coding: utf-8
 """This function checks if the given data is valid."""
 
-from os import makedirs
+from json import loads
+from os import environ, makedirs
+from time import time
+from typing import NamedTuple
 
-from utils import db_operation
-from error import BackendError
+from cache import LRUCache
+from id_codec import decode_hex_id
+from utils import call_after_commit, db_operation, get_session_user
+from migration import migrate, start_backfills
 
 CREATE_TASK_TABLE: str = (
     "CREATE TABLE IF NOT EXISTS task"
@@ -38,10 +43,66 @@ CREATE_GROUP_INVITES_TABLE: str = (
     "inviter_id TEXT NOT NULL, invitee_id TEXT NOT NULL, "
     "day_created REAL NOT NULL);"
 )
+# Every predicate a controller checks before doing any work, in one round
+# trip. The second value is 1 when a session already vouches for the user.
+# The last column lists the groups of the user to fill MEMBERSHIP_CACHE, it
+# is bound to NULL when the cache already knows them. JSON cannot hold the
+# blob ids, so they are listed as hex.
+AUTHORIZE_QUERY: str = (
+    "SELECT EXISTS(SELECT 1 FROM user WHERE uuid = ?), "
+    "? OR EXISTS(SELECT 1 FROM user WHERE uuid = ? AND password = ?), "
+    "EXISTS(SELECT 1 FROM task_group WHERE uuid = ?), "
+    "EXISTS(SELECT 1 FROM task WHERE uuid = ?), "
+    "(SELECT json_group_array(hex(group_id)) FROM group_user WHERE user_id = ?);"
+)
+USER_GROUPS_QUERY: str = "SELECT group_id FROM group_user WHERE user_id = ?;"
+CHECK_LOGIN_QUERY: str = "SELECT 1 FROM user WHERE email = ? AND password = ?;"
+CHECK_USERNAME_QUERY: str = "SELECT 1 FROM user WHERE username = ?;"
+CHECK_EMAIL_QUERY: str = "SELECT 1 FROM user WHERE email = ?;"
+MEMBERSHIP_CACHE_SIZE: int = 10000
+MEMBERSHIP_CACHE_TTL: float = 60.0
+
+# User id -> frozenset of the ids of the groups the user is in.
+MEMBERSHIP_CACHE: LRUCache = LRUCache(
+    max_size=MEMBERSHIP_CACHE_SIZE, ttl=MEMBERSHIP_CACHE_TTL
+)
+# Invites nobody answered are deleted after this many days, 0 keeps them.
+INVITE_TTL: float = float(environ.get("ROOMIEBUDDY_INVITE_TTL_DAYS", "30")) * 24 * 3600
+# Limits a query to the invites that have not expired, bound to invite_expiry.
+# Rows the migration backfill has not dated yet count as live.
+LIVE_INVITE_CONDITION: str = (
+    "(group_invites.created_at IS NULL OR group_invites.created_at >= ?)"
+)
+CHECK_INVITE_QUERY: str = (
+    "SELECT 1 FROM group_invites WHERE invitee_id = ? AND group_id = ? "
+    f"AND {LIVE_INVITE_CONDITION};"
+)
 UPLOAD_FOLDER: str = "data/images"
 ALLOWED_EXTENSIONS: set[str] = {"png", "jpg", "jpeg"}
 
 
+def invite_expiry() -> float:
+    """Gets the creation time before which an invite has expired.
+
+    Expired invites stay in the table until the sweeper deletes them, so
+    every read of group_invites compares against this.
+    """
+    return time() - INVITE_TTL if INVITE_TTL > 0 else 0.0
+
+
+class Authorization(NamedTuple):
+    """This class holds the result of Validator.authorize.
+
+    Checks for a group or task that was not asked for are always False.
+    """
+
+    user_exists: bool
+    password_correct: bool
+    group_exists: bool
+    in_group: bool
+    task_exists: bool
+
+
 class Validator:
     """This class checks if the given data is valid."""
 
@@ -54,80 +115,112 @@ class Validator:
 
         makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+        # The base tables are only created on a new database, every later
+        # change to them is a migration.
         with db_operation() as data_cursor:
             data_cursor.execute(CREATE_TASK_TABLE)
             data_cursor.execute(CREATE_USER_TABLE)
             data_cursor.execute(CREATE_GROUP_TABLE)
             data_cursor.execute(CREATE_GROUP_USER_TABLE)
             data_cursor.execute(CREATE_GROUP_INVITES_TABLE)
+        migrate()
+        start_backfills()
+
+    def authorize(
+        self,
+        user_id: str,
+        password: str,
+        group_id: str | None = None,
+        task_id: str | None = None,
+    ) -> Authorization:
+        """Checks the user, password, group, membership and task at once."""
+        session_ok: bool = not password and get_session_user() == user_id
+        group_ids: frozenset[str] | None = MEMBERSHIP_CACHE.get(user_id)
+        with db_operation() as data_cursor:
+            data_cursor.execute(
+                AUTHORIZE_QUERY,
+                (
+                    user_id,
+                    session_ok,
+                    user_id,
+                    password,
+                    group_id,
+                    task_id,
+                    user_id if group_ids is None else None,
+                ),
+            )
+            result: tuple = data_cursor.fetchone()
+        if group_ids is None:
+            group_ids = frozenset(decode_hex_id(value) for value in loads(result[4]))
+            if result[0]:
+                MEMBERSHIP_CACHE.put(user_id, group_ids)
+        return Authorization(
+            user_exists=bool(result[0]),
+            password_correct=bool(result[1]),
+            group_exists=bool(result[2]),
+            in_group=group_id in group_ids,
+            task_exists=bool(result[3]),
+        )
+
+    def get_user_groups(self, user_id: str) -> frozenset[str]:
+        """Gets the ids of the groups the user is in, from the cache if possible."""
+        group_ids: frozenset[str] | None = MEMBERSHIP_CACHE.get(user_id)
+        if group_ids is None:
+            with db_operation() as data_cursor:
+                data_cursor.execute(USER_GROUPS_QUERY, (user_id,))
+                group_ids = frozenset(row[0] for row in data_cursor.fetchall())
+            MEMBERSHIP_CACHE.put(user_id, group_ids)
+        return group_ids
+
+    def invalidate_membership(self, user_id: str) -> None:
+        """Forgets the cached groups of a user, now and once the change commits."""
+        MEMBERSHIP_CACHE.pop(user_id)
+        call_after_commit(lambda: MEMBERSHIP_CACHE.pop(user_id))
 
-            if (
-                len(data_cursor.execute("SELECT * FROM task;").description) != 14
-                or len(data_cursor.execute("SELECT * FROM user;").description) != 5
-                or len(data_cursor.execute("SELECT * FROM task_group;").description)
-                != 4
-                or len(data_cursor.execute("SELECT * FROM group_user;").description)
-                != 3
-                or len(data_cursor.execute("SELECT * FROM group_invites;").description)
-                != 5
-            ):
-                raise BackendError(
-                    "Backend Error: Not Been Configured Correctly, Ask Developers",
-                    "201",
-                )
+    def invalidate_group_membership(self, group_id: str) -> None:
+        """Forgets the cached groups of every member of a group."""
+
+        def forget() -> None:
+            MEMBERSHIP_CACHE.pop_where(lambda _user_id, groups: group_id in groups)
+
+        forget()
+        call_after_commit(forget)
 
     def check_user_exists(self, user_id: str) -> bool:
         """This function checks if the user exists."""
         with db_operation() as data_cursor:
-            data_cursor.execute("SELECT * FROM user WHERE uuid = ?;", (user_id,))
+            data_cursor.execute("SELECT 1 FROM user WHERE uuid = ?;", (user_id,))
             result = data_cursor.fetchone()
         return result is not None
 
     def check_group_exists(self, group_id: str) -> bool:
         """This function checks if the group exists."""
         with db_operation() as data_cursor:
-            data_cursor.execute("SELECT * FROM task_group WHERE uuid = ?;", (group_id,))
+            data_cursor.execute("SELECT 1 FROM task_group WHERE uuid = ?;", (group_id,))
             result = data_cursor.fetchone()
         return result is not None
 
     def check_task_exists(self, task_id: str) -> bool:
         """This function checks if the task exists."""
         with db_operation() as data_cursor:
-            data_cursor.execute("SELECT * FROM task WHERE uuid = ?;", (task_id,))
+            data_cursor.execute("SELECT 1 FROM task WHERE uuid = ?;", (task_id,))
             result = data_cursor.fetchone()
         return result is not None
 
     def check_user_in_group(self, user_id: str, group_id: str) -> bool:
         """This function checks if the user is in the group."""
-        with db_operation() as data_cursor:
-            data_cursor.execute(
-                "SELECT * FROM group_user WHERE user_id = ? AND group_id = ?;",
-                (user_id, group_id),
-            )
-            result = data_cursor.fetchone()
-        return result is not None
-
-    def check_duplicate_id(self, data_table: str, given_id: str) -> bool:
-        """Checks if id is not in use."""
-        with db_operation() as data_cursor:
-            if data_table == "task":
-                data_cursor.execute("SELECT * FROM task WHERE uuid = ?;", (given_id,))
-            elif data_table == "user":
-                data_cursor.execute("SELECT * FROM user WHERE uuid = ?;", (given_id,))
-            elif data_table == "group":
-                data_cursor.execute("SELECT * FROM task_group WHERE uuid = ?;", (given_id,))
-            elif data_table == "invite":
-                data_cursor.execute(
-                    "SELECT * FROM group_invites WHERE invite_id = ?;", (given_id,)
-                )
-            result = data_cursor.fetchone()
-        return result is not None
+        return group_id in self.get_user_groups(user_id)
 
     def check_password(self, user_id: str, password: str) -> bool:
-        """Checks if password is correct."""
+        """Checks if password is correct.
+
+        A request carrying a session of the user may leave the password empty.
+        """
+        if not password and get_session_user() == user_id:
+            return True
         with db_operation() as data_cursor:
             data_cursor.execute(
-                "SELECT * FROM user WHERE uuid = ? AND password = ?;",
+                "SELECT 1 FROM user WHERE uuid = ? AND password = ?;",
                 (user_id, password),
             )
             result = data_cursor.fetchone()
@@ -136,41 +229,31 @@ class Validator:
     def check_login(self, email: str, password: str) -> bool:
         """Checks if the user entered the correct credentials."""
         with db_operation() as data_cursor:
-            data_cursor.execute(
-                "SELECT * FROM user WHERE email = ? AND password = ?;",
-                (email, password),
-            )
+            data_cursor.execute(CHECK_LOGIN_QUERY, (email, password))
             result = data_cursor.fetchone()
         return result is not None
 
     def check_username(self, username: str) -> bool:
         """Checks if the username is already used."""
         with db_operation() as data_cursor:
-            data_cursor.execute(
-                "SELECT * FROM user WHERE username = ?;",
-                (username,),
-            )
+            data_cursor.execute(CHECK_USERNAME_QUERY, (username,))
             result = data_cursor.fetchone()
         return result is not None
 
     def check_email(self, email: str) -> bool:
         """Checks if the email is already used."""
         with db_operation() as data_cursor:
-            data_cursor.execute(
-                "SELECT * FROM user WHERE email = ?;",
-                (email,),
-            )
+            data_cursor.execute(CHECK_EMAIL_QUERY, (email,))
             result = data_cursor.fetchone()
         return result is not None
 
     def check_invite(
         self, invitee_id: str, group_id: str
     ) -> bool:
-        """Checks if the invite exists."""
+        """Checks if a live invite exists."""
         with db_operation() as data_cursor:
             data_cursor.execute(
-                "SELECT * FROM group_invites WHERE invitee_id = ? AND group_id = ?;",
-                (invitee_id, group_id),
+                CHECK_INVITE_QUERY, (invitee_id, group_id, invite_expiry())
             )
             result = data_cursor.fetchone()
         return result is not None